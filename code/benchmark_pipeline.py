@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+__author__ = 'QingboWang'
+
+#end to end benchmark on a synthetic cohort (util/synthetic_cohort.py), on the hail local backend:
+#  generate -> import (vcf -> mt) -> discovery (mnv_discovery.discover_mnv, checked against the expected counts)
+#  -> count matrices (cnt_matrix.get_cnt_matrix_alldist) -> classification + release assembly (release_assembly)
+#per stage: wall / cpu time, peak memory (python + children, i.e. the JVM), rows going into the shuffle, partitions.
+#one json line per run (with the git commit) appended to --out, and compared with the last run of the same parameters.
+#(Usage: benchmark_pipeline.py [--samples 200] [--variants 5000] [--window 10] [--out benchmark_results.jsonl])
+
+import argparse
+import json
+import resource
+import subprocess
+import tempfile
+import time as tm
+import numpy as np
+import pandas as pd
+import hail as hl
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "util"))
+from synthetic_cohort import *
+from mnv_discovery import *
+from cnt_matrix import *
+from release_assembly import assemble_release, annotate_consequence
+import instrument
+
+
+def peak_rss_mb():
+    #max resident set size so far, of this process and of the (waited) children. linux: kB
+    return ((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024.)
+
+class Stage(instrument.Stage):
+    #instrument.Stage (record in $MNV_STAGE_LOG), + peak memory and the stage info, kept in results for the run line
+    def __init__(self, results, name):
+        super(Stage, self).__init__(name)
+        self.results, self.name = results, name
+        self.info = {}
+    def __exit__(self, exc_type, exc, tb):
+        self.set(peak_rss_mb=round(peak_rss_mb(), 1), **self.info)
+        self.end(error=None if exc_type is None else exc_type.__name__)
+        self.results[self.name] = {k: self.rec[k] for k in ["wall_s", "cpu_s", "peak_rss_mb"] + list(self.info)}
+        return (False)
+
+def git_commit():
+    try:
+        return (subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip())
+    except (subprocess.CalledProcessError, OSError):
+        return (None)
+
+def compare(prev, cur):
+    for (stage, r) in cur["stages"].items():
+        if stage in prev["stages"]:
+            p = prev["stages"][stage]["wall_s"]
+            print ("{0}: {1}s (was {2}s at {3}, x{4:.2f})".format(stage, r["wall_s"], p, prev["commit"], r["wall_s"] / max(p, 1e-3)))
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--samples", type=int, default=200)
+parser.add_argument("--variants", type=int, default=5000)
+parser.add_argument("--length", type=int, default=500000)
+parser.add_argument("--planted", type=int, default=500)
+parser.add_argument("--hom_scale", type=float, default=1.0)
+parser.add_argument("--phased_frac", type=float, default=0.9)
+parser.add_argument("--block_bp", type=int, default=100)
+parser.add_argument("--window", type=int, default=10)
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--out", default="benchmark_results.jsonl")
+args = parser.parse_args()
+params = vars(args).copy()
+del params["out"]
+
+hl.init(quiet=True)
+tmp = tempfile.mkdtemp()
+res = {}
+
+with Stage(res, "generate") as s:
+    cohort = make_cohort(n_samples=args.samples, n_variants=args.variants, length=args.length, n_planted=args.planted,
+                         dists=range(1, args.window + 1), hom_scale=args.hom_scale, phased_frac=args.phased_frac,
+                         block_bp=args.block_bp, seed=args.seed)
+    write_vcf(cohort, tmp + "/cohort.vcf")
+    s.info["rows"] = len(cohort.variants)
+
+with Stage(res, "import") as s:
+    mt = hl.import_vcf(tmp + "/cohort.vcf", reference_genome="GRCh37")
+    mt = mt.annotate_rows(AC=hl.agg.sum(mt.GT.n_alt_alleles()), AF=hl.agg.mean(mt.GT.n_alt_alleles()) / 2)
+    mt = mt.select_rows("AC", "AF", "filters")
+    mt.write(tmp + "/cohort.mt")
+    mt = hl.read_matrix_table(tmp + "/cohort.mt")
+    s.info["partitions"] = mt.n_partitions()
+
+with Stage(res, "discovery") as s:
+    ht = discover_mnv(mt, window=args.window)
+    ht.write(tmp + "/mnv_combined.ht")
+    ht = hl.read_table(tmp + "/mnv_combined.ht")
+    s.info["rows"] = ht.count()
+    s.info["partitions"] = ht.n_partitions()
+#rows going into the group_by (not timed)
+res["discovery"]["rows_shuffled"] = annotate_mnv_classes(mnv_entries(mt, args.window)).count()
+
+#correctness: the same counts as the expected ones
+flat = ht.key_by()
+flat = flat.select(contig=flat.locus.contig, pos1=flat.prev_locus.position, pos2=flat.locus.position,
+                   refs=flat.prev_alleles[0] + flat.alleles[0], alts=flat.prev_alleles[1] + flat.alleles[1],
+                   AC=flat.AC, prev_AC=flat.prev_AC, **{c: flat[c] for c in COUNT_FIELDS}).to_pandas()
+exp = expected_mnv_counts(cohort, window=args.window)
+m = exp.merge(flat, on=["pos1", "pos2"], how="outer", suffixes=("", "_found")).fillna(0)
+res["discovery"]["n_expected"] = len(exp)
+res["discovery"]["n_mismatch"] = int(sum([(m[c] != m[c + "_found"]).sum() for c in COUNT_FIELDS]))
+res["discovery"]["planted_found"] = int(cohort.planted.merge(flat, on=["pos1", "pos2"]).shape[0])
+#the planted (cis) het pairs with a PID, against the discovery (not against expected_mnv_counts: same haplotypes)
+cis = planted_cis_counts(cohort).merge(flat, on=["pos1", "pos2"], how="left").fillna(0)
+res["discovery"]["n_planted_cis"] = int(cis.n_cis.sum())
+res["discovery"]["n_planted_cis_missed"] = int((cis.n_cis - cis.n_hethet - cis.n_hethet2).clip(lower=0).sum())
+print ("discovery check: {0} expected pairs, {1} mismatching counts, {2} of {3} planted cis het pairs missed".format(
+    len(exp), res["discovery"]["n_mismatch"], res["discovery"]["n_planted_cis_missed"], res["discovery"]["n_planted_cis"]))
+
+with Stage(res, "count_matrix") as s:
+    cnt = get_cnt_matrix_alldist(ht, dist_min=1, dist_max=args.window, part_size=None)
+    s.info["rows_shuffled"] = s.info["rows"] = int(filter_mnv_table(ht).count())
+    s.info["cells"] = int(sum([(c > 0).values.sum() for c in cnt.values()]))
+
+#classification / assembly on synthetic consequences of the d=1, 2 MNVs, half exome / half genome
+mnv = flat[(flat.pos2 - flat.pos1) <= 2].copy()
+d = mnv.pos2 - mnv.pos1
+mnv["locus.contig"] = mnv.contig.astype(str)
+mnv["refs"] = mnv.refs.str[0] + np.where(d == 2, "N", "") + mnv.refs.str[1]
+mnv["alts"] = mnv.alts.str[0] + np.where(d == 2, "N", "") + mnv.alts.str[1]
+mnv["AC_mnv"] = mnv.n_hethet + mnv.n_hethet2 + mnv.n_hethom + mnv.n_homhom * 2 + mnv.n_hemi
+cons = synthetic_consequences(mnv[mnv.AC_mnv > 0], np.random.default_rng(args.seed))
+with Stage(res, "classification") as s:
+    annotate_consequence(cons.copy())
+    s.info["rows"] = len(cons)
+with Stage(res, "assembly") as s:
+    half = np.random.default_rng(args.seed).random(len(cons)) < 0.5
+    t = assemble_release(cons[half].reset_index(drop=True), cons[~half].reset_index(drop=True))
+    s.info["rows"] = len(t)
+
+run = {"time": tm.strftime("%Y-%m-%dT%H:%M:%S"), "run_id": instrument.RUN_ID, "commit": git_commit(), "params": params, "stages": res}
+prev = None
+if os.path.exists(args.out):
+    with open(args.out) as f:
+        runs = [json.loads(l) for l in f if l.strip()]
+    prev = ([r for r in runs if r["params"] == params] or [None])[-1]
+with open(args.out, "a") as f:
+    f.write(json.dumps(run) + "\n")
+if prev is not None:
+    compare(prev, run)
@@ -4,6 +4,11 @@ import pandas as pd
 #initialize hail
 import hail as hl
 import hail.expr.aggregators as agg
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "util"))
+from cnt_matrix import *
+from storage import *
+from tsv_loader import *
 hl.init()
 
 
@@ -15,35 +20,6 @@ idx_met = ['Coding_UCSC', 'DHS_Trynka', 'Enhancer_Hoffman', 'H3K4me1_Trynka',
 idx_refs = ['AA', 'AC', 'AG', 'AT', 'CA', 'CC', 'CG', 'CT', 'GA', 'GC', 'GG', 'GT',
        'TA', 'TC', 'TG', 'TT']
 
-comp = {}
-comp["A"] = "T"
-comp["T"] = "A"
-comp["G"] = "C"
-comp["C"] = "G"
-comp["N"] = "N"
-
-def revcomp(seq):
-    out = ""
-    for i in seq[::-1]:
-        out = out + comp[i]
-    return (out)
-
-def collapse_crstb_to_revcomp(crstb):
-    # collaspse to a table, instead of another matrix
-    flt = crstb.stack().reset_index()
-    flt.columns = ['refs', 'alts', 'cnt']
-    for i in range(flt.shape[0]):
-        if i in flt.index:  # if it hasn't been deleted yet
-            refs_revcomp = revcomp(flt.refs[i])
-            alts_revcomp = revcomp(flt.alts[i])
-            ix_revcomp = flt[(flt.refs == refs_revcomp) & (flt.alts == alts_revcomp)].index[0]
-            if i != ix_revcomp:  # if revcomp is not yourself
-                flt.loc[i, "cnt"] = flt.loc[i, "cnt"] + flt.loc[ix_revcomp, "cnt"]
-                flt = flt.drop(ix_revcomp)
-    flt = flt[(flt.refs.str[0]!=flt.alts.str[0])&(flt.refs.str[1]!=flt.alts.str[1])]  # deleting trivial ones
-    flt.reset_index(inplace=True)
-    del flt["index"]
-    return (flt)
 
 #also collapse the reference counts
 def collapse_ref_cnts(ref_cnt_matrix):
@@ -65,26 +41,20 @@ categ = ["Coding_UCSC", "DHS_Trynka", "Enhancer_Hoffman", "H3K27ac_PGC2", "H3K4m
 
 
 #methylation level per annotation -- also need to re-do this once we have extra functional category..
-m = "gs://gnomad-qingbowang/MNV/agg_stats/met_score_final.tsv"
-with hl.hadoop_open(m, 'r') as f:
-        met = pd.read_table(f)
-
+st = get_storage()
+met = st.read_tsv(agg_stats("met_score_final.tsv"))
 
+#all the (small) ref cnts / case cnts at once (in parallel, one tensor for the case cnts), instead of one hadoop_open per file in the loop
+refcnts_all = read_tables([agg_stats("background_refcnts_d{0}.tsv".format(d)) for d in range(1,11)], TableSchema(), storage=st)
+(_, casecnts_all) = load_cnt_matrices([cnt_mat(d, c) for d in range(1,11) for c in categ], storage=st, strip_n=True)
 for d in range(1,11):
     df = pd.DataFrame()
-    m = "gs://gnomad-qingbowang/MNV/agg_stats/background_refcnts_d{0}.tsv".format(d)
-    with hl.hadoop_open(m, 'r') as f:
-        refcnts = pd.read_table(f) #ref cnts
+    refcnts = refcnts_all[d-1] #ref cnts
     refcnts.index = idx_refs
     refcnts = collapse_ref_cnts(refcnts)
-    for c in categ:
-            m = "gs://gnomad-qingbowang/MNV/wholegenome/cnt_mat_d{0}_{1}.tsv".format(d, c)
-            with hl.hadoop_open(m, 'r') as f:
-                casecnts = pd.read_table(f) #case cnts
-            casecnts.index = casecnts.columns 
-            casecnts.index = idx_refs
-            casecnts.columns = idx_refs #remove the Ns for now.
-            casecnts = collapse_crstb_to_revcomp(casecnts)
+    for (i, c) in enumerate(categ):
+            casecnts = cnt_matrix_frame(idx_refs, casecnts_all[(d-1)*len(categ) + i]) #case cnts. remove the Ns for now.
+            casecnts = collapse_crstb_to_revcomp(casecnts, drop_trivial=True)
             ref_of_case = refcnts.loc[:,c]
             casecnts[c] = casecnts.apply(lambda x: x["cnt"] / ref_of_case[x["refs"]], axis=1)
             df = pd.concat([df,casecnts[c]], axis=1, sort=True)
@@ -92,4 +62,4 @@ for d in range(1,11):
     ix = casecnts.refs.str[0] + "N"*(d-1) + casecnts.refs.str[1] + "->" + casecnts.alts.str[0] + "N"*(d-1) + casecnts.alts.str[1]
     df.index = ix
     print ("d={0} done".format(d))
-    hl.Table.from_pandas(df).export("{0}/mnv_density_percateg_d{0}.tsv".format(output_path,d))
+    st.write_tsv(df, wholegenome("mnv_density_percateg_d{0}.tsv".format(d)))
@@ -4,6 +4,9 @@ __author__ = 'QingboWang'
 import hail as hl
 import hail.expr.aggregators as agg
 from typing import *
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "util"))
+from release_lookup import *
 
 
 #first filter the et to relevant ones (bed file specifying the regions where MNV exists at all)
@@ -227,23 +230,25 @@ exgen.write("gs://gnomad-qingbowang/MNV/gnomAD_tNV_before_vep.ht")
 
 #also add the component SNPs info
 tnv = hl.read_table("gs://gnomad-qingbowang/MNV/gnomAD_tNV_before_vep.ht")
-final = hl.import_table("gs://gnomad-public/release/2.1/mnv/gnomad_mnv_coding.tsv")
-final = final.key_by("snp1","snp2")
-tnv = tnv.key_by("snp1","snp1_2")
-tnv = tnv.annotate(snp12_mnv_categ=final[tnv.key].categ,
-                   snp12_mnv_n_indv_ex=hl.int(final[tnv.key].n_indv_ex),
-                   snp12_mnv_n_indv_gen=hl.int(final[tnv.key].n_indv_gen),
-                   snp1_cons = final[tnv.key].snp1_consequence,
-                   snp2_cons = final[tnv.key].snp2_consequence)
-tnv = tnv.key_by("snp1","snp2")
-tnv = tnv.annotate(snp13_mnv_categ=final[tnv.key].categ,
-                   snp13_mnv_n_indv_ex=hl.int(final[tnv.key].n_indv_ex),
-                   snp13_mnv_n_indv_gen=hl.int(final[tnv.key].n_indv_gen),
-                   snp3_cons = final[tnv.key].snp2_consequence)
-tnv = tnv.key_by("snp1_2","snp2")
-tnv = tnv.annotate(snp23_mnv_categ=final[tnv.key].categ,
-                   snp23_mnv_n_indv_ex=hl.int(final[tnv.key].n_indv_ex),
-                   snp23_mnv_n_indv_gen=hl.int(final[tnv.key].n_indv_gen))
+#the coding release is small -> broadcast lookup instead of 3 joins (each of them re-keys and shuffles tnv)
+final = read_release("gs://gnomad-public/release/2.1/mnv/gnomad_mnv_coding.tsv")
+final_lookup = load_release_lookup(final, ["categ","n_indv_ex","n_indv_gen","snp1_consequence","snp2_consequence"],
+                                   types={"n_indv_ex": hl.tint32, "n_indv_gen": hl.tint32})
+tnv = tnv.annotate(m12 = final_lookup.get(snp_pair_key_from_str(tnv.snp1, tnv.snp1_2)),
+                   m13 = final_lookup.get(snp_pair_key_from_str(tnv.snp1, tnv.snp2)),
+                   m23 = final_lookup.get(snp_pair_key_from_str(tnv.snp1_2, tnv.snp2)))
+tnv = tnv.transmute(snp12_mnv_categ=tnv.m12.categ,
+                    snp12_mnv_n_indv_ex=tnv.m12.n_indv_ex,
+                    snp12_mnv_n_indv_gen=tnv.m12.n_indv_gen,
+                    snp1_cons = tnv.m12.snp1_consequence,
+                    snp2_cons = tnv.m12.snp2_consequence,
+                    snp13_mnv_categ=tnv.m13.categ,
+                    snp13_mnv_n_indv_ex=tnv.m13.n_indv_ex,
+                    snp13_mnv_n_indv_gen=tnv.m13.n_indv_gen,
+                    snp3_cons = tnv.m13.snp2_consequence,
+                    snp23_mnv_categ=tnv.m23.categ,
+                    snp23_mnv_n_indv_ex=tnv.m23.n_indv_ex,
+                    snp23_mnv_n_indv_gen=tnv.m23.n_indv_gen)
 
 
 #then, vep them
@@ -4,52 +4,46 @@ __author__ = 'QingboWang'
 import hail as hl
 import hail.expr.aggregators as agg
 from typing import *
+import pandas as pd
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "util"))
+from release_lookup import *
 
 
 output_path = "gs://gnomad-qingbowang/MNV/1206_exome"
+classes = ["et_het", "et_het2", "et_partially_hom", "et_hom_hom"] #mutually exclusive by construction -> union, no need to join
+
+#release category, as a broadcast lookup (snp1, snp2) -> categ.
+#the coding release is small (few hundred thousand rows), so we ship it to every partition instead of joining (=shuffling) the huge per sample table
+final = read_release("gs://gnomad-public/release/2.1/mnv/gnomad_mnv_coding.tsv", columns=["snp1","snp2","categ","n_indv_ex"])
+final = final[final.n_indv_ex.astype(int)>0]
+categ_lookup = load_release_lookup(final, ["categ"])
+
+cnt_all = None #per sample, per categ count. added per chromosome
 for chr in range(22,0,-1):
-    et_het = hl.read_table("{0}/tmp_MNV_exome_chr{1}_et_het.ht".format(output_path, chr))
-    et_het = et_het.annotate(snp1=hl.str(et_het.prev_row.locus.contig)+"-"+hl.str(et_het.prev_row.locus.position)+"-"+ et_het.prev_row.alleles[0] + "-" + et_het.prev_row.alleles[1],
-                             snp2=hl.str(et_het.locus.contig)+"-"+hl.str(et_het.locus.position)+"-"+ et_het.alleles[0] + "-" + et_het.alleles[1])
-    et_het = et_het.key_by("snp1","snp2")
-    et_het2 = hl.read_table("{0}/tmp_MNV_exome_chr{1}_et_het2.ht".format(output_path, chr))
-    et_het2 = et_het2.annotate(snp1=hl.str(et_het2.prev_row.locus.contig)+"-"+hl.str(et_het2.prev_row.locus.position)+"-"+ et_het2.prev_row.alleles[0] + "-" + et_het2.prev_row.alleles[1],
-                             snp2=hl.str(et_het2.locus.contig)+"-"+hl.str(et_het2.locus.position)+"-"+ et_het2.alleles[0] + "-" + et_het2.alleles[1])
-    et_het2 = et_het2.key_by("snp1","snp2")
-    et_partially_hom = hl.read_table("{0}/tmp_MNV_exome_chr{1}_et_partially_hom.ht".format(output_path, chr))
-    et_partially_hom = et_partially_hom.annotate(snp1=hl.str(et_partially_hom.prev_row.locus.contig)+"-"+hl.str(et_partially_hom.prev_row.locus.position)+"-"+ et_partially_hom.prev_row.alleles[0] + "-" + et_partially_hom.prev_row.alleles[1],
-                             snp2=hl.str(et_partially_hom.locus.contig)+"-"+hl.str(et_partially_hom.locus.position)+"-"+ et_partially_hom.alleles[0] + "-" + et_partially_hom.alleles[1])
-    et_partially_hom = et_partially_hom.key_by("snp1","snp2")
-    et_hom_hom = hl.read_table("{0}/tmp_MNV_exome_chr{1}_et_hom_hom.ht".format(output_path, chr))
-    et_hom_hom = et_hom_hom.annotate(snp1=hl.str(et_hom_hom.prev_row.locus.contig)+"-"+hl.str(et_hom_hom.prev_row.locus.position)+"-"+ et_hom_hom.prev_row.alleles[0] + "-" + et_hom_hom.prev_row.alleles[1],
-                             snp2=hl.str(et_hom_hom.locus.contig)+"-"+hl.str(et_hom_hom.locus.position)+"-"+ et_hom_hom.alleles[0] + "-" + et_hom_hom.alleles[1])
-    et_hom_hom = et_hom_hom.key_by("snp1","snp2")
-    et_het = et_het.key_by("snp1","snp2","s")
-    et_het2 = et_het2.key_by("snp1","snp2","s")
-    et_partially_hom = et_partially_hom.key_by("snp1","snp2","s")
-    et_hom_hom = et_hom_hom.key_by("snp1","snp2","s") #s is actually not needed cuz mutually exclusive? no it's needed. 同じmnvをたくさんの人が持ってるから.
-    et_union = et_het.join(et_het2, how='outer').join(et_partially_hom, how="outer").join(et_hom_hom, how="outer")
-    if chr==22:
-        et_all = et_union
+    ets = []
+    for c in classes:
+        et = hl.read_table("{0}/tmp_MNV_exome_chr{1}_{2}.ht".format(output_path, chr, c))
+        et = et.key_by()
+        #typed (locus, alleles) key, no need to build the snp1/snp2 strings for every sample
+        et = annotate_from_lookup(et, categ_lookup, snp_pair_key(et.prev_row.locus, et.prev_row.alleles, et.locus, et.alleles), ["categ"])
+        et = et.select("s", "categ")
+        ets.append(et)
+    et_union = ets[0].union(*ets[1:])
+    cnt = et_union.group_by("s","categ").aggregate(n = agg.count()).to_pandas() #at most n_sample * n_categ rows
+    cnt["categ"] = cnt.categ.fillna("NA")
+    cnt = cnt.set_index(["s","categ"]).n
+    if cnt_all is None:
+        cnt_all = cnt
     else:
-        et_all = et_all.join(et_union, how="outer")
+        cnt_all = cnt_all.add(cnt, fill_value=0)
     print ("done chr {0}".format(chr))
-et_all.select("s").write("gs://gnomad-qingbowang/MNV/tmp_exome_snp_pairs.ht", overwrite=True)
-final = hl.import_table("gs://gnomad-public/release/2.1/mnv/gnomad_mnv_coding.tsv", types={'n_indv_ex': hl.tint32})
-final = final.filter(final.n_indv_ex>0)
-
-#et_all.show()
-et_all= hl.read_table("gs://gnomad-qingbowang/MNV/tmp_exome_snp_pairs.ht")
-final = final.key_by()
-final = final.key_by("snp1","snp2")
-et_all = et_all.key_by()
-et_all = et_all.key_by("snp1","snp2")
-et_all = et_all.annotate(categ = final[et_all.key].categ)
-
-cnt = et_all.group_by("s","categ").aggregate(n = agg.count())
-sums = cnt.group_by("categ").aggregate(sums=hl.agg.sum(cnt.n))
+cnt_all = cnt_all.astype(int)
+with hl.hadoop_open("gs://gnomad-qingbowang/MNV/exome_per_sample_categ_cnt.tsv", 'w') as f:
+    cnt_all.reset_index().to_csv(f, sep="\t", index=False)
 
-sums.show()
+sums = cnt_all.groupby(level="categ").sum()
+print (sums)
 #output:
 """
 | "Changed missense"           |  5499378 |
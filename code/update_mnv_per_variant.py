@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+__author__ = 'QingboWang'
+
+#incremental update of MNV_exome_chr{N}_combined.ht (exome_mnv_per_variant_autosome_for_release.py output)
+#when a batch of samples is added: the per variant counts of the batch only, summed into the existing table.
+#AC / AF / filters re-annotated from the updated release, and the MNVs whose counts changed written separately
+#(_changed.ht) so that only those go through annotate_vep_mnv etc. again.
+#(Usage: update_mnv_per_variant.py batch_samples.txt [chr1,chr2,..]) batch_samples.txt: one sample id per line, no header
+#only the given chromosomes are updated (e.g. X,Y), all 24 contigs by default.
+
+import hail as hl
+import hail.expr.aggregators as agg
+from typing import *
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "util"))
+from resources import *
+from mnv_discovery import *
+from instrument import *
+
+output_path = "gs://gnomad-qingbowang/MNV/1206_exome"
+hl.init(tmp_dir="gs://gnomad-qingbowang/tmp")
+
+batch = hl.import_table(sys.argv[1], no_header=True).key_by("f0")
+chrs = sys.argv[2].split(",") if len(sys.argv) > 2 else [str(i) for i in range(22,0,-1)] + ["X", "Y"]
+
+mt_all = get_gnomad_data("exomes", release_samples=True, adj=True, release_annotations=True)
+mt_batch = mt_all.filter_cols(hl.is_defined(batch[mt_all.s]))
+
+for chr in chrs:
+    start_stage("discover_batch", contig=chr, output="{0}/MNV_exome_chr{1}_batch.ht".format(output_path, chr))
+    mt = hl.filter_intervals(mt_batch, [hl.parse_locus_interval(chr)])
+    info = variant_info(hl.filter_intervals(mt_all, [hl.parse_locus_interval(chr)])) #AC / AF of the whole updated release
+    mt = mt.select_rows(AC = mt.freq[0].AC, AF = mt.freq[0].AF, filters = mt.filters)
+    new = discover_mnv(mt, is_male=(mt.meta.sex == "male"))
+    new.write("{0}/MNV_exome_chr{1}_batch.ht".format(output_path, chr), overwrite=True)
+    new = hl.read_table("{0}/MNV_exome_chr{1}_batch.ht".format(output_path, chr))
+    start_stage("merge_counts", contig=chr, output="{0}/MNV_exome_chr{1}_combined_updated.ht".format(output_path, chr))
+    old = hl.read_table("{0}/MNV_exome_chr{1}_combined.ht".format(output_path, chr))
+    merged = merge_mnv_counts(old, new, info)
+    #can't overwrite the table being read -> written next to it, to be renamed once checked
+    merged.write("{0}/MNV_exome_chr{1}_combined_updated.ht".format(output_path, chr), overwrite=True)
+    merged = hl.read_table("{0}/MNV_exome_chr{1}_combined_updated.ht".format(output_path, chr))
+    changed_mnvs(merged).write("{0}/MNV_exome_chr{1}_changed.ht".format(output_path, chr), overwrite=True)
+    (n_changed, n_new) = merged.aggregate((agg.count_where(merged.changed), agg.count_where(merged.is_new)))
+    end_stage(rows_out=merged.count(), n_changed=n_changed, n_new=n_new)
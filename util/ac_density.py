@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+__author__ = 'QingboWang'
+
+#density of MNVs in the 3D allele count space log10(ac1, ac2, ac_mnv) (tutorials/global_mechanisms.ipynb), i.e.
+#the number of MNVs within radius (in log10 units) of each point, without filtering the whole frame per point
+#(num_around_in_log): the distinct (ac1, ac2, ac_mnv) triples are counted while the MNV_chr*_d*_context.tsv exports
+#(code/annotate_context.py) are read in chunks, a KD-tree is built once on them (per distance), and the radius
+#queries of a whole grid / all the MNVs are answered in batches, weighted by the number of MNVs per triple.
+#  dens = AcDensity.from_tsvs([...context.tsv of d=1...])     #or build_densities(range(1, 23), range(1, 11))
+#  n_around = dens.point_density(df, radius=0.2)               #= df.apply(num_around_in_log) (the MNV itself included)
+#  (axes, cnt) = dens.grid_counts(n=40, radius=0.2)            #n x n x n grid over the range of the data
+#rows with a count of 0 (no log) are left out (n_dropped).
+#(Usage: ac_density.py points out.tsv MNV_chr22_d1_context.tsv [...] [--radius 0.2])
+
+import argparse
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+AC_COLUMNS = ["ac1", "ac2", "ac_mnv"]
+CHUNKSIZE = 500000
+QUERY_BATCH = 100000 #query points per batch (the neighbour lists of a batch are in memory together)
+
+
+def to_log(ac):
+    return (np.log10(np.asarray(ac, dtype=float)))
+
+
+class AcDensity(object):
+    def __init__(self):
+        self.triples = pd.DataFrame({c: pd.Series([], dtype="int64") for c in AC_COLUMNS + ["n"]})
+        self.n_dropped = 0
+        self.tree = None
+
+    def add(self, df):
+        #df with ac1, ac2, ac_mnv (one row per MNV), e.g. a chunk of a context tsv
+        ac = df[AC_COLUMNS].astype("int64")
+        ok = (ac > 0).all(axis=1)
+        self.n_dropped += int((~ok).sum())
+        cnt = ac[ok].groupby(AC_COLUMNS).size().rename("n").reset_index()
+        self.triples = pd.concat([self.triples, cnt]).groupby(AC_COLUMNS)["n"].sum().reset_index()
+        self.tree = None
+        return (self)
+
+    def build(self):
+        self.points = to_log(self.triples[AC_COLUMNS].values)
+        self.weights = self.triples.n.values
+        self.tree = cKDTree(self.points)
+        return (self)
+
+    @classmethod
+    def from_frame(cls, df):
+        return (cls().add(df).build())
+
+    @classmethod
+    def from_tsvs(cls, paths, storage=None, chunksize=CHUNKSIZE):
+        #paths: local / pandas readable paths, or keys of storage (storage.py). chunksize rows in memory at a time
+        dens = cls()
+        for p in paths:
+            f = p if storage is None else storage.open(p)
+            try:
+                for chunk in pd.read_csv(f, sep="\t", usecols=AC_COLUMNS, chunksize=chunksize):
+                    dens.add(chunk)
+            finally:
+                if storage is not None: f.close()
+        return (dens.build())
+
+    @property
+    def n_mnv(self):
+        return (int(self.weights.sum()))
+
+    def counts(self, query, radius=0.2, log=True):
+        #number of MNVs strictly within radius of each query point. query: (m, 3), log10 values (log=True) or counts
+        if self.tree is None: self.build()
+        q = np.atleast_2d(np.asarray(query, dtype=float))
+        if not log: q = to_log(q)
+        r = np.nextafter(radius, 0) #the tree counts distance <= r, num_around_in_log counted < radius
+        out = np.zeros(len(q), dtype="int64")
+        for s in range(0, len(q), QUERY_BATCH):
+            hits = self.tree.query_ball_point(q[s:s + QUERY_BATCH], r)
+            lens = np.array([len(h) for h in hits])
+            if lens.sum() == 0: continue
+            w = np.concatenate([[0], np.cumsum(self.weights[np.concatenate(hits).astype(int)])])
+            ends = np.cumsum(lens)
+            out[s:s + QUERY_BATCH] = w[ends] - w[ends - lens]
+        return (out)
+
+    def triple_density(self, radius=0.2):
+        #the distinct triples with their number of MNVs (n) and the density around them
+        if self.tree is None: self.build()
+        return (self.triples.assign(density=self.counts(self.points, radius)))
+
+    def point_density(self, df, radius=0.2):
+        #density at each row of df (ac1, ac2, ac_mnv), in the order of df. nan for the rows with a count of 0
+        dens = self.triple_density(radius).drop(columns="n")
+        ac = df[AC_COLUMNS].astype("int64").reset_index(drop=True)
+        return (ac.merge(dens, on=AC_COLUMNS, how="left").density.values)
+
+    def grid(self, n=40, lo=None, hi=None):
+        #n points per axis over [lo, hi] (log10, default: the range of the data). (axes, (n^3, 3) points)
+        if self.tree is None: self.build()
+        lo = self.points.min(axis=0) if lo is None else np.broadcast_to(lo, 3)
+        hi = self.points.max(axis=0) if hi is None else np.broadcast_to(hi, 3)
+        axes = [np.linspace(lo[k], hi[k], n) for k in range(3)]
+        mesh = np.meshgrid(*axes, indexing="ij")
+        return ((axes, np.stack([m.ravel() for m in mesh], axis=1)))
+
+    def grid_counts(self, n=40, radius=0.2, lo=None, hi=None):
+        #(axes, n x n x n counts), cnt[i, j, k] around (axes[0][i], axes[1][j], axes[2][k])
+        (axes, q) = self.grid(n, lo, hi)
+        return ((axes, self.counts(q, radius).reshape(n, n, n)))
+
+
+def build_densities(chrs=range(1, 23), ds=range(1, 11), storage=None, chunksize=CHUNKSIZE):
+    #{d: AcDensity} from the context tsvs of all the chromosomes (through storage.py, default get_storage())
+    from storage import get_storage, mnv_context
+    storage = get_storage() if storage is None else storage
+    return ({d: AcDensity.from_tsvs([mnv_context(chr, d) for chr in chrs], storage, chunksize) for d in ds})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["points"])
+    parser.add_argument("out")
+    parser.add_argument("tsvs", nargs="+")
+    parser.add_argument("--radius", type=float, default=0.2)
+    parser.add_argument("--chunksize", type=int, default=CHUNKSIZE)
+    args = parser.parse_args()
+    dens = AcDensity.from_tsvs(args.tsvs, chunksize=args.chunksize)
+    dens.triple_density(args.radius).to_csv(args.out, sep="\t", index=False)
+    print ("{0} MNVs ({1} distinct ac1, ac2, ac_mnv, {2} dropped) -> {3}".format(dens.n_mnv, len(dens.triples), dens.n_dropped, args.out))
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+__author__ = 'QingboWang'
+
+#count matrix of MNVs (refs x alts), shared by the get_cnt_matrix*.py, classify_onestep.py, vs_mnv10_enrichment.py etc.
+#(from cnt_matrix import *)
+
+import pandas as pd
+import hail as hl
+import hail.expr.aggregators as agg
+from resources import resolve_path
+from instrument import stage
+from partition_planner import plan_partitions, estimate_counts
+from mnv_classify import revcomp
+from mnv_null import collapse_crstb_to_revcomp
+
+
+def filter_mnv_table(mnv_table, region="ALL", PASS=True, hom=False, skip_invalid_intervals=False):
+    # region = bed file, defining the regions of interest (e.g. enhancer region)
+    # PASS=True: restrict to both pass variants, PASS="NO": exclusively getting at least one non-pass ones, PASS=False: all
+    # hom=True: restrict to MNVs seen as homozygote in at least one individual
+    if region != "ALL":
+        bed = hl.import_bed(resolve_path(region), skip_invalid_intervals=skip_invalid_intervals)
+        mnv_table = mnv_table.filter(hl.is_defined(bed[mnv_table.locus]))
+    if PASS=="NO":
+        mnv_table = mnv_table.filter((mnv_table.filters.length() > 0) | (mnv_table.prev_filters.length() > 0))
+    elif PASS==True:
+        mnv_table = mnv_table.filter((mnv_table.filters.length() == 0) & (mnv_table.prev_filters.length() == 0))
+    if hom:
+        mnv_table = mnv_table.filter(mnv_table.n_homhom>0)
+    # we don't care indels anymore -- restricting to SNPs
+    return (mnv_table.filter((mnv_table.alleles[0].length() == 1) &
+                             (mnv_table.alleles[1].length() == 1) &
+                             (mnv_table.prev_alleles[0].length() == 1) &
+                             (mnv_table.prev_alleles[1].length() == 1)))
+
+def rows_per_dist(mnv):
+    # mnv = already filtered table (filter_mnv_table). {dist: rows}, estimated in one (sampled) job for all the distances,
+    # for the n_rows of count_per_dist (otherwise one estimate per distance)
+    return (estimate_counts(mnv.annotate(d=mnv.locus.position - mnv.prev_locus.position), "d"))
+
+def count_per_dist(mnv, dist, minimum_cnt=0, part_size="auto", n_rows=None):
+    # mnv = already filtered table (filter_mnv_table)
+    # part_size = "auto": partition_planner decides from the size (n_rows: from rows_per_dist, or estimated here),
+    # None: no repartition, int: that many partitions
+    mnv = mnv.filter((mnv.locus.position - mnv.prev_locus.position) == dist)  # filter to that specific distance
+    if part_size == "auto":
+        mnv = plan_partitions(mnv, "mnv", n_rows=n_rows, stage="cnt_matrix", dist=dist)
+    elif part_size is not None:
+        mnv = mnv.repartition(part_size) #repartition to proper size
+    mnv_cnt = mnv.group_by("alleles", "prev_alleles").aggregate(cnt=agg.count())  # count occurance
+    mnv_cnt = mnv_cnt.annotate(
+        refs=mnv_cnt.prev_alleles[0] + "N" * (dist - 1) + mnv_cnt.alleles[0])  # annotate combined refs
+    mnv_cnt = mnv_cnt.annotate(
+        alts=mnv_cnt.prev_alleles[1] + "N" * (dist - 1) + mnv_cnt.alleles[1])  # annotate combined alts
+    if minimum_cnt > 0: mnv_cnt = mnv_cnt.filter((mnv_cnt.cnt > minimum_cnt))  # remove trivial ones
+    return (mnv_cnt.select("refs", "alts", "cnt"))
+
+def get_cnt_matrix(mnv_table, region="ALL", dist=1, minimum_cnt=0, PASS=True, part_size="auto", hom=False, n_rows=None):
+    # mnv_table = hail table of mnvs
+    # dist = distance between two SNPs
+    # part_size = None: no repartition, "auto": see count_per_dist
+    # n_rows = rows of that distance after the filters, if known (e.g. rows_per_dist(filter_mnv_table(..))[dist])
+    # (the union of the get_cnt_matrix variants that were in each script: hom= and PASS="NO" are from get_cnt_matrix_hom/nonpass.py)
+    mnv = filter_mnv_table(mnv_table, region=region, PASS=PASS, hom=hom)
+    return (count_per_dist(mnv, dist, minimum_cnt=minimum_cnt, part_size=part_size, n_rows=n_rows))
+
+def get_cnt_matrix_alldist(mnv_table, region="ALL", dist_min=1, dist_max=10, minimum_cnt=0, PASS=True, part_size="auto"):
+    #give a distance range, instead of single distance. returns a dictionary of dataframe
+    mnv_table = filter_mnv_table(mnv_table, region=region, PASS=PASS, skip_invalid_intervals=True)
+    n_d = rows_per_dist(mnv_table) if part_size == "auto" else {}
+    pdall = {}
+    for dist in range(dist_min, (dist_max+1)):
+        with stage("cnt_matrix", dist=dist, rows_in=n_d.get(dist)):
+            pdall[dist] = ht_cnt_mat_to_pd(count_per_dist(mnv_table, dist, minimum_cnt=minimum_cnt, part_size=part_size,
+                                                          n_rows=n_d.get(dist, 0) if part_size == "auto" else None)) #saving as pandas dataframe, in dictionary
+    return (pdall)
+
+def get_cnt_tensor(mnv_table, strata=None, region="ALL", dist_min=1, dist_max=10, PASS=True, part_size="auto"):
+    #counts of all the distances and strata in one group_by, instead of one get_cnt_matrix per distance and stratum
+    #strata: function of the filtered table -> expression (e.g. lambda t: t.onestep), None: a single stratum
+    #-> table dist, stratum, refs, alts (the two SNPs, without the Ns), cnt. to numpy: tsv_loader.cnt_tensor(t.to_pandas(), ..)
+    mnv = filter_mnv_table(mnv_table, region=region, PASS=PASS, skip_invalid_intervals=True)
+    mnv = mnv.annotate(d=mnv.locus.position - mnv.prev_locus.position)
+    mnv = mnv.filter((mnv.d >= dist_min) & (mnv.d <= dist_max))
+    if part_size == "auto":
+        mnv = plan_partitions(mnv, "mnv", stage="cnt_tensor")
+    elif part_size is not None:
+        mnv = mnv.repartition(part_size)
+    mnv_cnt = mnv.group_by(dist=mnv.d, stratum=hl.null(hl.tbool) if strata is None else strata(mnv),
+                           refs=mnv.prev_alleles[0] + mnv.alleles[0],
+                           alts=mnv.prev_alleles[1] + mnv.alleles[1]).aggregate(cnt=agg.count())
+    return (mnv_cnt)
+
+def ht_cnt_mat_to_pd(ht_cnt_mat):
+    pds = ht_cnt_mat.to_pandas()
+    pds.fillna(value=0, inplace=True)
+    pds = pds.iloc[:, 2:]
+    pds = pd.pivot_table(pds, index="refs", columns="alts")
+    pds.fillna(value=0, inplace=True)
+    pds.columns = pds.columns.get_level_values(1)  # to set the columns name properly.
+    return (pds) #returning the pandas table
+
+def hl_strc_to_pd_df(strc,lname):
+    #from hail struct, create a dataframe of single line
+    dict = {}
+    for k in strc.keys():
+        dict[k] = strc[k]
+    return (pd.DataFrame(dict, index=[lname]))
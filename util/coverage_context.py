@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+__author__ = 'QingboWang'
+
+#coverage per 8bp sequence context, without going through hail.
+#same output as get_coverage_8bp.py (8bp_cov_3of8.tsv, 8bp_cov_4of8.tsv),
+#but the contexts are 16bit integer codes (2bit per base) instead of strings,
+#and both the forward / backward windows are accumulated in a single pass over the coverage table.
+#(Usage: coverage_context.py coverage_tsv reference_fasta output_dir)
+
+import numpy as np
+import pandas as pd
+import sys, os
+
+K = 8 #8bp context
+N_CODES = 4**K #=65536
+BASES = "ACGT"
+
+#ascii -> 2bit code. anything other than ACGT (N etc) -> 4, i.e. invalid
+#(soft-masked lower case bases are counted together with the upper case ones)
+base_code = np.full(256, 4, dtype=np.uint8)
+for i, b in enumerate(BASES):
+    base_code[ord(b)] = i
+    base_code[ord(b.lower())] = i
+
+
+def read_fai(fai_path):
+    #returns {contig: (length, offset, linebases, linewidth)}
+    fai = {}
+    with open(fai_path) as f:
+        for l in f:
+            l = l.rstrip("\n").split("\t")
+            fai[l[0]] = (int(l[1]), int(l[2]), int(l[3]), int(l[4]))
+    return (fai)
+
+def open_reference(fasta_path, fai_path=None):
+    #memory map the (uncompressed) fasta. nothing is read until we slice it
+    if fai_path is None: fai_path = fasta_path + ".fai"
+    return (np.memmap(fasta_path, dtype=np.uint8, mode="r"), read_fai(fai_path))
+
+def contig_slice(fasta_mm, fai_entry, start, end):
+    #2bit codes of the bases [start, end) (0-based) of a contig, skipping the newlines
+    length, offset, linebases, linewidth = fai_entry
+    start = max(start, 0)
+    end = min(end, length)
+    if end <= start: return (np.zeros(0, dtype=np.uint8))
+    first_line = start // linebases
+    last_line = (end - 1) // linebases
+    raw = np.asarray(fasta_mm[offset + first_line * linewidth: offset + (last_line + 1) * linewidth])
+    nfull = len(raw) // linewidth
+    seq = raw[:nfull * linewidth].reshape(nfull, linewidth)[:, :linebases].ravel()
+    if nfull * linewidth < len(raw): #last line of the contig is shorter
+        seq = np.concatenate([seq, raw[nfull * linewidth:][:linebases]])
+    seq = seq[start - first_line * linebases: end - first_line * linebases]
+    return (base_code[seq])
+
+def kmer_codes(codes2bit, k=K):
+    #rolling 2bit hash: codes[i] = code of the k-mer starting at i (first base = highest bits)
+    #valid[i] = False if the k-mer contains N etc.
+    n = len(codes2bit) - k + 1
+    if n <= 0: return (np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=bool))
+    codes = np.zeros(n, dtype=np.uint32)
+    valid = np.ones(n, dtype=bool)
+    for j in range(k):
+        w = codes2bit[j:j + n]
+        codes = (codes << 2) | (w & 3)
+        valid &= (w < 4)
+    return (codes, valid)
+
+def decode_kmer(code, k=K):
+    out = ""
+    for j in range(k):
+        out = out + BASES[(code >> (2 * (k - 1 - j))) & 3]
+    return (out)
+
+def encode_kmer(seq):
+    code = 0
+    for b in seq:
+        code = (code << 2) | BASES.index(b.upper())
+    return (code)
+
+
+def accumulate_chunk(fasta_mm, fai_entry, pos, cov, sums, cnts):
+    #pos: 1-based positions (sorted, single contig), cov: coverage per position
+    #forward window = before 3, after 4 (position is the 4th base -> 3of8)
+    #backward window = before 4, after 3 (position is the 5th base -> 4of8)
+    #both windows come from a single k-mer code array over the span of this chunk
+    span_start = max(pos[0] - 1 - 4, 0) #0-based start of the first backward window
+    seq = contig_slice(fasta_mm, fai_entry, span_start, pos[-1] - 1 + 4 + 1)
+    codes, valid = kmer_codes(seq)
+    for w, before in enumerate([3, 4]):
+        ix = pos - 1 - before - span_start #windows running over the contig edges are out of range
+        ok = (ix >= 0) & (ix < len(codes))
+        ix_ok = ix[ok]
+        ok[ok] = valid[ix_ok]
+        c = codes[ix[ok]]
+        sums[w] += np.bincount(c, weights=cov[ok], minlength=N_CODES)
+        cnts[w] += np.bincount(c, minlength=N_CODES)
+
+def coverage_by_context(coverage_path, fasta_path, fai_path=None, cov_col="median", chunksize=5000000, contigs=None):
+    #stream the gnomAD coverage tsv (chrom, pos, mean, median, ...), and accumulate
+    #the sum and count of coverage per 8bp context, into fixed size arrays (2, 65536)
+    #(0 = forward, context_fw. 1 = backward, context_bw)
+    fasta_mm, fai = open_reference(fasta_path, fai_path)
+    sums = np.zeros([2, N_CODES])
+    cnts = np.zeros([2, N_CODES], dtype=np.int64)
+    reader = pd.read_csv(coverage_path, sep="\t", usecols=["chrom", "pos", cov_col],
+                         dtype={"chrom": str}, chunksize=chunksize,
+                         compression="gzip" if coverage_path.endswith((".gz", ".bgz")) else None)
+    for chunk in reader:
+        for chr, t in chunk.groupby("chrom", sort=False):
+            if (contigs is not None) and (chr not in contigs): continue
+            accumulate_chunk(fasta_mm, fai[chr], t.pos.values, t[cov_col].values.astype(float), sums, cnts)
+    return (sums, cnts)
+
+def context_table(sums, cnts, col_name):
+    #same format as the hail export: context, mean coverage (only the contexts observed)
+    obs = np.nonzero(cnts)[0]
+    return (pd.DataFrame({col_name[0]: [decode_kmer(c) for c in obs],
+                          col_name[1]: sums[obs] / cnts[obs]}))
+
+def coverage_factor(sums, cnts):
+    #coverage factor (FofC) per 4bp context, as used in draw_null_matrix_dnv: cov.loc[fourbs, "FofC"]
+    #the 4bp = refs +-1bp of a dNV at position p,p+1 = the middle 4 bases of the 8bp window,
+    #i.e. the same 8bp is the fw context of SNP1 (3of8) and bw context of SNP2 (4of8).
+    #FofC = (mean cov. of SNP1 / genome wide mean) * (mean cov. of SNP2 / genome wide mean),
+    #so that the expectation is scaled by the detectability of both SNPs.
+    mid = (np.arange(N_CODES) >> 4) & 0xFF #middle 4 bases (base 2-5) of the 8bp code
+    out = {}
+    for w, name in enumerate(["mean_cov_3of8", "mean_cov_4of8"]):
+        s = np.bincount(mid, weights=sums[w], minlength=256)
+        n = np.bincount(mid, weights=cnts[w], minlength=256)
+        global_mean = sums[w].sum() / cnts[w].sum()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[name] = s / n
+        out[name + "_rel"] = out[name] / global_mean
+    cov = pd.DataFrame(out, index=[decode_kmer(c, k=4) for c in range(256)])
+    cov["FofC"] = cov.mean_cov_3of8_rel * cov.mean_cov_4of8_rel
+    return (cov)
+
+def coverage_factor_from_tsv(fw_path, bw_path):
+    #re-derive FofC from the already exported 8bp_cov_3of8.tsv, 8bp_cov_4of8.tsv
+    #(mean of means, since the count per context is not in the export -> use coverage_by_context if possible)
+    sums = np.zeros([2, N_CODES])
+    cnts = np.zeros([2, N_CODES])
+    for w, (path, cols) in enumerate([(fw_path, ["context_fw", "mean_cov_fw"]), (bw_path, ["context_bw", "mean_cov_bw"])]):
+        t = pd.read_csv(path, sep="\t")
+        t = t[t[cols[0]].str.upper().str.fullmatch("[ACGT]{8}")]
+        codes = np.array([encode_kmer(x) for x in t[cols[0]]])
+        sums[w][codes] = t[cols[1]].values
+        cnts[w][codes] = 1
+    return (coverage_factor(sums, cnts))
+
+
+#4bp context counts stratified by coverage, for the coverage aware null model (draw_null_matrix_dnv_cov)
+#4bp = dinucleotide at p, p+1 (+-1bp), and the depth of the dinucleotide = min(depth at p, depth at p+1)
+def default_cov_bins(max_depth=100):
+    #1x resolution up to max_depth (the last bin is >=max_depth), so that any integer threshold is exact
+    return (np.arange(0, max_depth + 1))
+
+def stratify_4mer_counts(codes2bit, depth, bins):
+    #codes2bit: 2bit codes of a contig (or a stretch of it), depth: per base depth of the same stretch (bigwig-like array)
+    #returns counts array (256, len(bins)), bins = lower edges
+    codes, valid = kmer_codes(codes2bit, k=4)
+    d = np.minimum(depth[1:len(codes) + 1], depth[2:len(codes) + 2]) #depth at the middle 2 bases
+    valid = valid & ~np.isnan(d)
+    b = np.digitize(d[valid], bins) - 1
+    ok = b >= 0
+    return (np.bincount(codes[valid][ok].astype(np.int64) * len(bins) + b[ok], minlength=256 * len(bins)).reshape(256, len(bins)))
+
+def context_counts_by_cov_bin(coverage_path, fasta_path, fai_path=None, cov_col="median", bins=None, chunksize=5000000, contigs=None):
+    #same as stratify_4mer_counts, but streaming over the gnomAD coverage tsv (positions without coverage = not counted)
+    if bins is None: bins = default_cov_bins()
+    fasta_mm, fai = open_reference(fasta_path, fai_path)
+    cnts = np.zeros([256, len(bins)], dtype=np.int64)
+    carry = {} #last row of the previous chunk, per contig, so that the pairs at the chunk boundary are not lost
+    reader = pd.read_csv(coverage_path, sep="\t", usecols=["chrom", "pos", cov_col],
+                         dtype={"chrom": str}, chunksize=chunksize,
+                         compression="gzip" if coverage_path.endswith((".gz", ".bgz")) else None)
+    for chunk in reader:
+        for chr, t in chunk.groupby("chrom", sort=False):
+            if (contigs is not None) and (chr not in contigs): continue
+            pos = t.pos.values
+            cov = t[cov_col].values.astype(float)
+            if chr in carry:
+                pos = np.concatenate([[carry[chr][0]], pos])
+                cov = np.concatenate([[carry[chr][1]], cov])
+            carry[chr] = (pos[-1], cov[-1])
+            #dense depth array over the span (NaN where the coverage table has no entry)
+            span_start = max(pos[0] - 1 - 1, 0)
+            depth = np.full(pos[-1] + 2 - span_start, np.nan)
+            depth[pos - 1 - span_start] = cov
+            seq = contig_slice(fasta_mm, fai[chr], span_start, pos[-1] - 1 + 2 + 1)
+            cnts += stratify_4mer_counts(seq, depth[:len(seq)], bins)
+    return (pd.DataFrame(cnts, index=[decode_kmer(c, k=4) for c in range(256)], columns=bins))
+
+
+if __name__ == "__main__":
+    (coverage_path, fasta_path, out_dir) = sys.argv[1:4]
+    sums, cnts = coverage_by_context(coverage_path, fasta_path)
+    context_table(sums[0], cnts[0], ["context_fw", "mean_cov_fw"]).to_csv(os.path.join(out_dir, "8bp_cov_3of8.tsv"), sep="\t", index=False)
+    context_table(sums[1], cnts[1], ["context_bw", "mean_cov_bw"]).to_csv(os.path.join(out_dir, "8bp_cov_4of8.tsv"), sep="\t", index=False)
+    coverage_factor(sums, cnts).to_csv(os.path.join(out_dir, "4bp_cov_factor.tsv"), sep="\t")
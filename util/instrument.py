@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+__author__ = 'QingboWang'
+
+#stage level timing, instead of print(tm.ctime()) pairs: one json line per stage (name, contig, distance, wall / cpu time,
+#rows in / out, bytes written) appended to $MNV_STAGE_LOG (default mnv_stages.jsonl), and a one line print.
+#  with stage("write_het", contig=chr, output=path) as s: ...  #context manager
+#  @timed("collapse")                                          #decorator
+#  start_stage("vep", contig=chr, dist=1, input=t) ... start_stage("categ", ...) ... end_stage()  #sequential scripts:
+#                                                               starting a stage ends the previous one (the last one: at exit)
+#row counts force a hail evaluation, so they are only taken when MNV_STAGE_COUNT_ROWS=1: rows_in from input= (counted
+#before the clock starts), rows_out from the output (.ht: its metadata, .tsv: its lines) or set(rows_out=..).
+#hail is lazy: a stage only measures the work done inside it, so a stage should end on something that runs the
+#pipeline (write, checkpoint, export, to_pandas, count), not on building expressions.
+#(Usage: instrument.py summary mnv_stages.jsonl [--by stage,contig,dist] [--top 20]) ranks the hotspots of a run.
+
+import argparse
+import atexit
+import functools
+import json
+import os
+import socket
+import time as tm
+from collections import OrderedDict
+
+RUN_ID = os.environ.get("MNV_RUN_ID", "{0}-{1}".format(tm.strftime("%Y%m%d-%H%M%S"), os.getpid()))
+
+
+def log_path():
+    return (os.environ.get("MNV_STAGE_LOG", "mnv_stages.jsonl"))
+
+def count_enabled():
+    return (os.environ.get("MNV_STAGE_COUNT_ROWS", "0") == "1")
+
+def count_rows(t):
+    #hail table / matrix table (rows), or anything with len(). None if counting is disabled
+    if not count_enabled(): return (None)
+    if hasattr(t, "__len__"): return (len(t)) #pandas / lists (DataFrame.count is per column)
+    if hasattr(t, "count_rows"): return (t.count_rows())
+    return (t.count())
+
+def path_bytes(path):
+    #total size of a file / directory (e.g. a .ht), local or through hadoop (gs://)
+    if "://" not in path:
+        path = os.path.expanduser(path)
+        if os.path.isfile(path): return (os.path.getsize(path))
+        return (sum([os.path.getsize(os.path.join(d, f)) for (d, _, fs) in os.walk(path) for f in fs]))
+    import hail as hl
+    total = 0
+    for x in hl.hadoop_ls(path):
+        total += path_bytes(x["path"]) if x["is_dir"] else x["size_bytes"]
+    return (total)
+
+def count_lines(path):
+    #data lines of a (single file, uncompressed) tsv, local or through hadoop. None for anything else
+    if path.endswith(".bgz") or path.endswith(".gz"): return (None)
+    if "://" not in path:
+        path = os.path.expanduser(path)
+        if not os.path.isfile(path): return (None)
+        f = open(path)
+    else:
+        import hail as hl
+        if hl.hadoop_is_dir(path): return (None)
+        f = hl.hadoop_open(path)
+    with f:
+        return (max(sum(1 for _ in f) - 1, 0)) #header
+
+def write_record(rec):
+    with open(log_path(), "a") as f:
+        f.write(json.dumps(rec) + "\n")
+    where = " ".join(["{0}={1}".format(k, rec[k]) for k in ["contig", "dist"] if rec.get(k) is not None])
+    print ("[{0}] {1} {2}s{3}".format(rec["stage"], where, rec["wall_s"],
+                                      "" if rec.get("rows_out") is None else " rows_out={0}".format(rec["rows_out"])))
+
+
+class Stage(object):
+    def __init__(self, name, contig=None, dist=None, output=None, rows_in=None, input=None, **fields):
+        #input: the table the stage reads, for rows_in (counted only if enabled)
+        self.rec = OrderedDict(stage=name, contig=None if contig is None else str(contig), dist=dist,
+                               rows_in=rows_in, rows_out=None, bytes_written=None, **fields)
+        self.output = output
+        self.input = input
+
+    def __enter__(self):
+        return (self.start())
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end(error=None if exc_type is None else exc_type.__name__)
+        return (False)
+
+    def start(self):
+        if (self.rec["rows_in"] is None) and (self.input is not None):
+            self.rec["rows_in"] = count_rows(self.input) #before the clock starts
+        self.input = None
+        self.t0, self.c0 = tm.time(), tm.process_time()
+        self.rec["start"] = tm.strftime("%Y-%m-%dT%H:%M:%S")
+        return (self)
+
+    def set(self, **fields):
+        self.rec.update(fields)
+
+    def end(self, error=None):
+        self.rec["wall_s"] = round(tm.time() - self.t0, 3)
+        self.rec["cpu_s"] = round(tm.process_time() - self.c0, 3) #python driver cpu only (not the workers)
+        if (self.output is not None) and (error is None):
+            try:
+                self.rec["bytes_written"] = path_bytes(self.output)
+                if (self.rec["rows_out"] is None) and count_enabled():
+                    if self.output.endswith(".ht"):
+                        import hail as hl
+                        self.rec["rows_out"] = hl.read_table(self.output).count() #from the partition counts, no pass over the data
+                    else:
+                        self.rec["rows_out"] = count_lines(self.output)
+            except Exception: #best effort, never fail the pipeline for it
+                pass
+        self.rec.update(run_id=RUN_ID, host=socket.gethostname(), error=error)
+        write_record(self.rec)
+
+def stage(name, **fields):
+    return (Stage(name, **fields))
+
+def timed(name=None, **fields):
+    def deco(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            with Stage(name or f.__name__, **fields):
+                return (f(*args, **kwargs))
+        return (wrapper)
+    return (deco)
+
+
+_current = None
+
+def start_stage(name, **fields):
+    #ends the running stage (if any) and starts a new one
+    global _current
+    end_stage()
+    _current = Stage(name, **fields).start()
+    return (_current)
+
+def end_stage(**fields):
+    global _current
+    if _current is not None:
+        _current.set(**fields)
+        _current.end()
+    _current = None
+
+atexit.register(end_stage) #the last stage of a script
+
+
+def read_log(path):
+    with open(path) as f:
+        return ([json.loads(l) for l in f if l.strip()])
+
+def summary(records, by=("stage",), top=20, run_id=None):
+    #total wall time per group, ranked. run_id=None: the last run in the log
+    if run_id is None and len(records) > 0: run_id = records[-1].get("run_id")
+    records = [r for r in records if r.get("run_id") == run_id]
+    groups = OrderedDict()
+    for r in records:
+        k = tuple([r.get(b) for b in by])
+        g = groups.setdefault(k, {"n": 0, "wall_s": 0.0, "max_s": 0.0, "rows_out": 0, "bytes_written": 0})
+        g["n"] += 1
+        g["wall_s"] += r["wall_s"]
+        g["max_s"] = max(g["max_s"], r["wall_s"])
+        g["rows_out"] += r.get("rows_out") or 0
+        g["bytes_written"] += r.get("bytes_written") or 0
+    total = sum([g["wall_s"] for g in groups.values()])
+    ranked = sorted(groups.items(), key=lambda x: -x[1]["wall_s"])[:top]
+    return (run_id, total, ranked)
+
+def print_summary(records, by=("stage",), top=20, run_id=None):
+    (run_id, total, ranked) = summary(records, by, top, run_id)
+    print ("run {0}: {1:.1f}s in total".format(run_id, total))
+    print ("\t".join(list(by) + ["n", "wall_s", "share", "max_s", "rows_out", "bytes_written"]))
+    for (k, g) in ranked:
+        print ("\t".join([str(x) for x in k] + [str(g["n"]), "{0:.1f}".format(g["wall_s"]),
+                                                "{0:.1%}".format(g["wall_s"] / total if total > 0 else 0),
+                                                "{0:.1f}".format(g["max_s"]), str(g["rows_out"]), str(g["bytes_written"])]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["summary"])
+    parser.add_argument("log", nargs="?", default=log_path())
+    parser.add_argument("--by", default="stage")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--run")
+    args = parser.parse_args()
+    print_summary(read_log(args.log), tuple(args.by.split(",")), args.top, args.run)
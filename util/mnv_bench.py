@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+__author__ = 'QingboWang'
+
+#micro benchmarks of the hot functions of mnv_functions.py (mnv_classify / mnv_null / mnv_plot), on realistic inputs:
+#VEP consequence arrays, amino acid changes, 4bp contexts, SNV mutation table, 16x16 and 100x100 count matrices.
+#per function: time per call, calls per second, peak memory allocated in python (tracemalloc).
+#golden outputs (fixed seed) can be saved and checked, so that a faster version can be validated against the current one,
+#and alternative implementations (ALTERNATIVES) are checked against the reference before they are timed.
+#(Usage: mnv_bench.py [function ...] [--save-golden dir | --check-golden dir] [--n 2000])
+
+import argparse
+import os
+import pickle
+import time as tm
+import tracemalloc
+import numpy as np
+import pandas as pd
+import mnv_classify
+import mnv_null
+
+BASES = ["A", "C", "G", "T"]
+CONS_TERMS = ["missense_variant", "synonymous_variant", "stop_gained", "stop_lost", "start_lost", "stop_retained_variant",
+              "splice_region_variant", "intron_variant", "NMD_transcript_variant", "5_prime_UTR_variant", "3_prime_UTR_variant"]
+AAS = ["A", "R", "N", "D", "C", "Q", "E", "G", "H", "I", "L", "K", "M", "F", "P", "S", "T", "W", "Y", "V", "*"]
+
+
+#input generators
+def gen_cons_terms(n, rng):
+    #VEP consequence_terms arrays, 1-3 terms, missense / synonymous most common
+    p = np.array([30, 25, 3, 1, 1, 1, 10, 10, 5, 2, 2], dtype=float)
+    return ([list(rng.choice(CONS_TERMS, rng.integers(1, 4), replace=False, p=p / p.sum())) for _ in range(n)])
+
+def gen_category_args(n, rng):
+    #(snp1_con, snp2_con, mnv_con, aa1, aa2, aa3) as in mnv_coding_parse.py
+    cons = np.array(["missense_variant", "synonymous_variant", "stop_gained", "stop_lost", "start_lost", "stop_retained_variant"])
+    p = np.array([50, 35, 5, 3, 2, 5], dtype=float) / 100
+    aa = lambda: rng.choice(AAS) + "/" + rng.choice(AAS) if rng.random() < 0.8 else rng.choice(AAS)
+    return ([tuple(rng.choice(cons, 3, p=p)) + (aa(), aa(), aa()) for _ in range(n)])
+
+def gen_contexts(n, rng, length=4):
+    return (["".join(rng.choice(BASES, length)) for _ in range(n)])
+
+def gen_max_repeat_args(n, rng, length=12):
+    #sequence contexts around an MNV, mer 1-3
+    return ([(c, int(m)) for (c, m) in zip(gen_contexts(n, rng, length), rng.integers(1, 4, n))])
+
+def gen_mut_table(rng):
+    #SNV mutation rate per 3bp context (from, to, mu_snp), all 64 x 3
+    rows = []
+    for a in BASES:
+        for b in BASES:
+            for c in BASES:
+                for x in BASES:
+                    if x != b:
+                        mu = rng.lognormal(-20, 1) * (10 if (b + c == "CG" and x == "T") else 1)
+                        rows.append((a + b + c, a + x + c, mu))
+    return (pd.DataFrame(rows, columns=["from", "to", "mu_snp"]))
+
+def gen_dnv_pairs(n, rng):
+    #(ref 4bp, alt 4bp) where the middle 2 bases both change
+    out = []
+    for ref in gen_contexts(n, rng):
+        alt = ref[0] + rng.choice([b for b in BASES if b != ref[1]]) + rng.choice([b for b in BASES if b != ref[2]]) + ref[3]
+        out.append((ref, alt))
+    return (out)
+
+def revcomp_closed_labels(size, k=None, sep=""):
+    #size labels (k-mers) closed under reverse complement (pairs, and palindromes if needed)
+    if k is None: k = max(2, int(np.ceil(np.log(size) / np.log(4))))
+    kmers = [""]
+    for _ in range(k):
+        kmers = [x + b for x in kmers for b in BASES]
+    fmt = lambda x: sep.join(x)
+    labels = []
+    seen = set()
+    for x in kmers:
+        if (x in seen) or (len(labels) >= size): continue
+        rc = mnv_classify.revcomp(x)
+        if rc == x:
+            if len(labels) + 1 <= size: labels.append(fmt(x))
+        elif len(labels) + 2 <= size:
+            labels += [fmt(x), fmt(rc)]
+        seen |= {x, rc}
+    return (labels)
+
+def gen_count_matrix(size, rng, sep=""):
+    #square count matrix, labels closed under revcomp, no zeros (calc_symmetry divides)
+    labels = revcomp_closed_labels(size, sep=sep)
+    return (pd.DataFrame(rng.poisson(50, (len(labels), len(labels))) + 1, index=labels, columns=labels))
+
+def gen_null_matrix_args(rng, n_contexts=256):
+    #draw_null_matrix_dnv(obs_refs, cols, cov): 4bp counts, the 16 "M,N" labels, FofC per 4bp
+    cols = [a + "," + b for a in BASES for b in BASES]
+    fourbs = sorted(set(gen_contexts(n_contexts * 4, rng)))[:n_contexts]
+    obs_refs = pd.Series(rng.integers(1000, 100000, len(fourbs)), index=fourbs)
+    cov = pd.DataFrame({"FofC": rng.uniform(0.5, 1.0, len(fourbs))}, index=fourbs)
+    return ((obs_refs, cols, cov))
+
+
+#cases: name -> (function, list of argument tuples). built lazily (mut_table needs to be set first)
+def _calc_symmetry(crosstab):
+    import mnv_plot
+    return (mnv_plot.calc_symmetry(crosstab)) #the matrix only (the rendering is mnv_report's)
+
+def make_cases(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    mnv_null.set_mut_table(gen_mut_table(rng))
+    m16 = gen_count_matrix(16, rng)
+    m100 = gen_count_matrix(100, rng)
+    return ({"mnv_category": (mnv_classify.mnv_category, gen_category_args(n, rng)),
+             "cons_term_most_severe": (mnv_classify.cons_term_most_severe, [(x,) for x in gen_cons_terms(n, rng)]),
+             "max_repeat": (mnv_classify.max_repeat, gen_max_repeat_args(n, rng)),
+             "revcomp": (mnv_classify.revcomp, [(x,) for x in gen_contexts(n, rng)]),
+             "prob_dNV_null": (mnv_null.prob_dNV_null, gen_dnv_pairs(max(n // 10, 1), rng)),
+             "draw_null_matrix_dnv": (mnv_null.draw_null_matrix_dnv, [gen_null_matrix_args(rng, 16)]),
+             "collapse_crstb_to_revcomp_16": (mnv_null.collapse_crstb_to_revcomp, [(m16,)]),
+             "collapse_crstb_to_revcomp_100": (mnv_null.collapse_crstb_to_revcomp, [(m100,)]),
+             "calc_symmetry_and_collapse_16": (mnv_null.calc_symmetry_and_collapse, [(m16,)]),
+             "calc_symmetry_and_collapse_100": (mnv_null.calc_symmetry_and_collapse, [(m100,)]),
+             "calc_symmetry_16": (_calc_symmetry, [(m16,)])})
+
+
+#alternative implementations: case name -> {label: function}, checked against the reference output before timing
+_comp = str.maketrans("ACGTN,", "TGCAN,")
+def revcomp_translate(seq):
+    return (seq.translate(_comp)[::-1])
+
+ALTERNATIVES = {"revcomp": {"translate": revcomp_translate}}
+
+
+#harness
+def run(fn, args_list):
+    return ([fn(*a) for a in args_list])
+
+def bench(fn, args_list, repeat=3, min_time=0.2):
+    #best of repeat passes (each pass at least min_time), + python peak memory of one pass
+    n_pass = 1
+    t0 = tm.perf_counter()
+    run(fn, args_list)
+    t = tm.perf_counter() - t0
+    if t < min_time: n_pass = int(np.ceil(min_time / max(t, 1e-9)))
+    best = t
+    for _ in range(repeat):
+        t0 = tm.perf_counter()
+        for _ in range(n_pass):
+            run(fn, args_list)
+        best = min(best, (tm.perf_counter() - t0) / n_pass)
+    tracemalloc.start()
+    run(fn, args_list)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    n = len(args_list)
+    return ({"calls": n, "us_per_call": best / n * 1e6, "calls_per_s": n / best, "peak_kb": peak / 1024.})
+
+def same_output(x, y):
+    if isinstance(x, pd.DataFrame) or isinstance(x, pd.Series):
+        try:
+            if isinstance(x, pd.DataFrame): pd.testing.assert_frame_equal(x, y, check_dtype=False, check_exact=False)
+            else: pd.testing.assert_series_equal(x, y, check_dtype=False, check_exact=False)
+            return (True)
+        except AssertionError:
+            return (False)
+    if isinstance(x, (list, tuple)):
+        return (len(x) == len(y) and all([same_output(a, b) for (a, b) in zip(x, y)]))
+    if isinstance(x, (float, np.floating)):
+        return (bool(np.isclose(x, y, rtol=1e-9, atol=0, equal_nan=True)))
+    return (x == y)
+
+def bench_case(name, fn, args_list):
+    out = {"reference": bench(fn, args_list)}
+    if name in ALTERNATIVES:
+        ref = run(fn, args_list)
+        for (label, alt) in ALTERNATIVES[name].items():
+            ok = same_output(ref, run(alt, args_list))
+            out[label] = bench(alt, args_list) if ok else {"error": "output differs from the reference"}
+            if ok: out[label]["speedup"] = out["reference"]["us_per_call"] / out[label]["us_per_call"]
+    return (out)
+
+def save_golden(cases, golden_dir):
+    os.makedirs(golden_dir, exist_ok=True)
+    for (name, (fn, args_list)) in cases.items():
+        with open(os.path.join(golden_dir, name + ".pkl"), "wb") as f:
+            pickle.dump(run(fn, args_list), f)
+
+def check_golden(cases, golden_dir):
+    #name -> True / False (None if there is no golden output for the case)
+    res = {}
+    for (name, (fn, args_list)) in cases.items():
+        p = os.path.join(golden_dir, name + ".pkl")
+        if not os.path.exists(p):
+            res[name] = None
+            continue
+        with open(p, "rb") as f:
+            res[name] = same_output(pickle.load(f), run(fn, args_list))
+    return (res)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("functions", nargs="*")
+    parser.add_argument("--n", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save-golden")
+    parser.add_argument("--check-golden")
+    args = parser.parse_args()
+    cases = make_cases(args.n, args.seed)
+    if args.functions:
+        cases = {k: v for (k, v) in cases.items() if any([k.startswith(f) for f in args.functions])}
+    if args.save_golden:
+        save_golden(cases, args.save_golden)
+    elif args.check_golden:
+        for (name, ok) in check_golden(cases, args.check_golden).items():
+            print ("{0}\t{1}".format(name, {True: "ok", False: "DIFFERS", None: "no golden output"}[ok]))
+    else:
+        for (name, (fn, args_list)) in cases.items():
+            try:
+                for (label, r) in bench_case(name, fn, args_list).items():
+                    print ("{0}\t{1}\t{2}".format(name, label, ", ".join(["{0}={1:.4g}".format(k, v) if isinstance(v, float) else "{0}={1}".format(k, v) for (k, v) in r.items()])))
+            except ImportError as e:
+                print ("{0}\tskipped ({1})".format(name, e))
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+__author__ = 'QingboWang'
+
+#MNV discovery (per variant pair counts of individuals: n_hethet, n_hethet2, n_hethom, n_homhom) as in
+#exome_mnv_per_variant_autosome_for_release.py, but in one aggregation (count_where per class) instead of
+#4 filtered tables + 4 group_by + 3 outer joins.
+#the counts are sums over individuals, so they are additive over disjoint sample sets: a new batch of samples is
+#discovered alone (discover_mnv on the batch) and merged into the existing MNV_*_combined.ht (merge_mnv_counts).
+#AC / AF / filters are cohort level, not additive -> re-annotated from the variant table of the updated release.
+#ploidy aware, so that X / Y go through the same pass as the autosomes: the 4 diploid classes need both calls diploid,
+#n_hemi counts individuals haploid (hemizygous) at both variants and carrying both. a call is haploid if its ploidy is 1
+#(gnomAD hard calls of males outside of the PARs), or, with is_male given, for males outside of the PARs even if the
+#call is diploid (then only hom var counts as a carrier, a male het there is a genotyping error and ignored).
+#in the PARs males are diploid and counted as on the autosomes. autosomes: n_hemi = 0.
+#each MNV also gets the one-step flag (onestep_flag: the two SNVs and the MNV have the same allele count, i.e. likely
+#arose in a single event), recomputed after a merge since AC is re-annotated there.
+
+import hail as hl
+
+MNV_KEY = ["locus", "alleles", "prev_locus", "prev_alleles"]
+#key of MNV_*_combined.ht
+COMBINED_KEY = ["locus", "alleles", "prev_locus", "prev_alleles", "dist", "AF", "AC", "filters", "prev_AF", "prev_AC", "prev_filters"]
+COUNT_FIELDS = ["n_hethet", "n_hethet2", "n_hethom", "n_homhom", "n_hemi"]
+CONTIGS = [str(i) for i in range(1, 23)] + ["X", "Y"]
+#exact: ac1 == ac2 == ac_mnv, ac_only: ac1 == ac2 (the definition of the paper / the earlier cnt_mat_d*_onest_exact.tsv),
+#tolerance: max - min of (ac1, ac2, ac_mnv) <= max(abs_tol, rel_tol * max)
+ONESTEP_MODES = ["exact", "ac_only", "tolerance"]
+
+
+def mnv_entries(mt, window=2):
+    #one row per (sample, variant, previous variant within the window) where both are non ref
+    #mt: rows with AC, AF, filters (select_rows), entries with GT, PID
+    mt = mt.filter_entries(mt.GT.is_non_ref())
+    mt = hl.window_by_locus(mt, window)
+    mt = mt.filter_entries((hl.is_defined(mt.GT) & (mt.prev_entries.length() > 0)))
+    mt = mt.filter_entries(mt.prev_entries.filter(lambda x: x.GT.is_non_ref()).length() > 0)
+    et = mt.key_cols_by().entries()
+    et = et.annotate(indices = hl.range(0, hl.len(et.prev_rows)))
+    et = et.explode('indices')
+    et = et.transmute(prev_row = et.prev_rows[et.indices],
+                      prev_entry = et.prev_entries[et.indices])
+    et = et.annotate(dist=et.locus.position - et.prev_row.locus.position)
+    #SNPs only, d>0 (before the classes, not after the group_by)
+    return (et.filter((et.alleles[0].length() == 1) & (et.alleles[1].length() == 1) &
+                      (et.prev_row.alleles[0].length() == 1) & (et.prev_row.alleles[1].length() == 1) & (et.dist != 0)))
+
+def is_haploid(gt, locus, is_male=None):
+    haploid = gt.ploidy == 1
+    if is_male is not None:
+        haploid = haploid | (is_male & (locus.in_x_nonpar() | locus.in_y_nonpar()))
+    return (haploid)
+
+def is_hemi_carrier(gt):
+    #haploid call with the alt, or (male outside of the PARs coded as diploid) hom var
+    return (hl.cond(gt.ploidy == 1, gt.is_non_ref(), gt.is_hom_var()))
+
+def annotate_mnv_classes(et):
+    #the 4 mutually exclusive classes of the release scripts (diploid at both variants) + hemi
+    is_male = et.is_male if "is_male" in et.row else None
+    hap = is_haploid(et.GT, et.locus, is_male)
+    prev_hap = is_haploid(et.prev_entry.GT, et.prev_row.locus, is_male)
+    diploid = ~hap & ~prev_hap
+    same_pid = hl.is_defined(et.PID) & hl.is_defined(et.prev_entry.PID) & (et.PID == et.prev_entry.PID)
+    both_het = et.GT.is_het_ref() & et.prev_entry.GT.is_het_ref()
+    #het het, PID edge unphased case: the previous variant is the (unphased) edge of the PID block, treated as 0|1
+    is_edge = et.prev_entry.PID.split("_")[0] == hl.format('%s', et.prev_row.locus.position)
+    return (et.annotate(homhom = diploid & et.GT.is_hom_var() & et.prev_entry.GT.is_hom_var(),
+                        hethom = diploid & ((et.GT.is_hom_var() & et.prev_entry.GT.is_het_ref()) | (et.GT.is_het_ref() & et.prev_entry.GT.is_hom_var())),
+                        hethet = diploid & same_pid & (et.GT.phased & et.prev_entry.GT.phased) & both_het & (et.GT == et.prev_entry.GT),
+                        hethet2 = diploid & same_pid & et.GT.phased & both_het & hl.or_else(is_edge, False) & (~et.prev_entry.GT.phased) &
+                                  (et.GT == hl.call(0, 1, phased=True)),
+                        hemi = hap & prev_hap & is_hemi_carrier(et.GT) & is_hemi_carrier(et.prev_entry.GT)))
+
+def count_mnv_classes(et):
+    #per variant pair counts, same schema as MNV_*_combined.ht
+    et = et.filter(et.hethet | et.hethet2 | et.hethom | et.homhom | et.hemi)
+    et = et.key_by()
+    et = et.select(locus=et.locus, alleles=et.alleles, prev_locus=et.prev_row.locus, prev_alleles=et.prev_row.alleles,
+                   dist=et.dist, AF=et.AF, AC=et.AC, filters=et.filters,
+                   prev_AF=et.prev_row.AF, prev_AC=et.prev_row.AC, prev_filters=et.prev_row.filters,
+                   hethet=et.hethet, hethet2=et.hethet2, hethom=et.hethom, homhom=et.homhom, hemi=et.hemi)
+    return (et.group_by(*COMBINED_KEY).aggregate(n_hethet=hl.agg.count_where(et.hethet),
+                                                 n_hethet2=hl.agg.count_where(et.hethet2),
+                                                 n_hethom=hl.agg.count_where(et.hethom),
+                                                 n_homhom=hl.agg.count_where(et.homhom),
+                                                 n_hemi=hl.agg.count_where(et.hemi)))
+
+def ac_mnv(t):
+    #allele count of the MNV (as AC_mnv of the release)
+    return (t.n_hethet + t.n_hethet2 + t.n_hethom + t.n_homhom * 2 + t.n_hemi)
+
+def onestep_flag(ac1, ac2, ac_mnv, mode="exact", rel_tol=0.1, abs_tol=0):
+    if mode == "exact":
+        return ((ac1 == ac2) & (ac2 == ac_mnv))
+    if mode == "ac_only":
+        return (ac1 == ac2)
+    if mode == "tolerance":
+        hi = hl.max(ac1, ac2, ac_mnv)
+        return ((hi - hl.min(ac1, ac2, ac_mnv)) <= hl.max(abs_tol, rel_tol * hi))
+    raise ValueError("onestep mode {0} not in {1}".format(mode, ONESTEP_MODES))
+
+def annotate_onestep(t, mode="exact", rel_tol=0.1, abs_tol=0):
+    #combined table (AC, prev_AC, counts) -> + onestep
+    return (t.annotate(onestep=onestep_flag(t.prev_AC, t.AC, ac_mnv(t), mode, rel_tol, abs_tol)))
+
+#per sample entry tables of the release scripts (tmp_MNV_exome_chr{N}_<name>.ht), read by per_sample_stats.py, get_tnv_gnomAD.py
+ENTRY_CLASSES = {"et_het": "hethet", "et_het2": "hethet2", "et_partially_hom": "hethom", "et_hom_hom": "homhom"}
+
+def class_entries(mt, window=2, is_male=None):
+    #per sample entries of all the classes (mnv_entries + annotate_mnv_classes), for count_mnv_classes / write_class_entries
+    if is_male is not None:
+        mt = mt.select_cols(is_male=is_male)
+    et = annotate_mnv_classes(mnv_entries(mt, window))
+    return (et.filter(et.hethet | et.hethet2 | et.hethom | et.homhom | et.hemi))
+
+def write_class_entries(et, path):
+    #path: with {0} for the class name, e.g. "gs://.../tmp_MNV_exome_chr1_{0}.ht". one table per class of ENTRY_CLASSES
+    for (name, c) in ENTRY_CLASSES.items():
+        et.filter(et[c]).write(path.format(name), overwrite=True)
+
+def discover_mnv(mt, window=2, is_male=None, onestep_mode="exact", et=None):
+    #mt: one chromosome (hl.filter_intervals), rows AC / AF / filters -> combined table (n_hethet, .. n_homhom, n_hemi, onestep)
+    #is_male: column expression (e.g. mt.meta.sex == "male"), for data where males are not haploid outside of the PARs
+    #et: class_entries already computed (e.g. checkpointed, to also write_class_entries), instead of mt
+    if et is None:
+        et = class_entries(mt, window, is_male)
+    return (annotate_onestep(count_mnv_classes(et), onestep_mode))
+
+def variant_info(mt):
+    #AC / AF / filters per variant, from the release (freq[0] = adj, all release samples)
+    rows = mt.rows()
+    return (rows.select(AC=rows.freq[0].AC, AF=rows.freq[0].AF, filters=rows.filters))
+
+def with_count_fields(t):
+    #tables written before n_hemi existed: 0
+    return (t.annotate(**{f: hl.int64(0) for f in COUNT_FIELDS if f not in t.row}))
+
+def merge_mnv_counts(old, new, info=None, onestep_mode="exact"):
+    #old: existing combined table, new: combined table of a disjoint sample batch (discover_mnv)
+    #-> summed counts, with is_new (not in old) and changed (counts changed by the batch, to be re-annotated downstream)
+    #info: variant_info of the updated release, to re-annotate AC / AF / filters (None: keep the old ones)
+    #onestep: recomputed from the summed counts and the (re-annotated) AC
+    old = with_count_fields(old).key_by(*MNV_KEY)
+    new = with_count_fields(new).key_by(*MNV_KEY)
+    new = new.select(*(["dist", "AF", "AC", "filters", "prev_AF", "prev_AC", "prev_filters"] + COUNT_FIELDS))
+    new = new.rename({f: f + "_new" for f in list(new.row_value)})
+    t = old.join(new, how="outer")
+    t = t.annotate(is_new=hl.is_missing(t.n_hethet), changed=hl.is_defined(t.n_hethet_new))
+    t = t.annotate(**{f: hl.or_else(t[f], 0) + hl.or_else(t[f + "_new"], 0) for f in COUNT_FIELDS})
+    t = t.annotate(**{f: hl.or_else(t[f], t[f + "_new"]) for f in ["dist", "AF", "AC", "filters", "prev_AF", "prev_AC", "prev_filters"]})
+    t = t.drop(*[f for f in list(t.row_value) if f.endswith("_new")])
+    if info is not None:
+        info = info.key_by("locus", "alleles")
+        v = info[t.locus, t.alleles]
+        pv = info[t.prev_locus, t.prev_alleles]
+        t = t.annotate(AF=v.AF, AC=v.AC, filters=v.filters, prev_AF=pv.AF, prev_AC=pv.AC, prev_filters=pv.filters)
+    return (annotate_onestep(t, onestep_mode).key_by(*COMBINED_KEY))
+
+def changed_mnvs(merged):
+    #MNVs to re-annotate (consequence etc.): the ones whose counts changed
+    return (merged.filter(merged.changed))
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+__author__ = 'QingboWang'
+
+#local lookup service: were these two SNVs (e.g. 1-138593-G-T, 1-138594-C-A) seen in cis as an MNV in gnomAD, and which categ?
+#the releases (coding: gnomad_mnv_coding.tsv / parquet, genome: gnomad_mnv_genome_d*.tsv, anything with snp1 / snp2 columns)
+#are loaded into a sorted array of packed uint64 keys, one per SNV pair:
+#  contig (5bit) | position of snp1 (28bit) | ref1, alt1 (2bit each) | distance (8bit) | ref2, alt2 (2bit each)
+#and looked up with a binary search (numpy searchsorted), single or batched.
+#the release files are checked for updates (mtime) and the index is rebuilt in the background and swapped.
+#(Usage: mnv_lookup_service.py port release_file1 [release_file2 ...])
+#  GET  /lookup?snp1=1-138593-G-T&snp2=1-138594-C-A
+#  POST /lookup  {"pairs": [["1-138593-G-T", "1-138594-C-A"], ...]}
+#  GET  /health
+
+import json
+import os
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+
+CONTIG_CODE = {c: i + 1 for i, c in enumerate([str(i) for i in range(1, 23)] + ["X", "Y"])}
+BASE_CODE = {"A": 0, "C": 1, "G": 2, "T": 3}
+VALUE_COLUMNS = ["categ", "transcript_id", "n_indv", "AC_mnv", "n_homhom", "snp1_consequence", "snp2_consequence", "mnv_consequence"]
+COUNT_COLUMNS = ["n_indv", "AC_mnv", "n_homhom"] #integers in the answers, as in the parquet releases
+INVALID = np.uint64(0) #contig code starts from 1, so 0 is never a valid key
+
+
+def pack_pair(snp1, snp2):
+    #"1-138593-G-T", "1-138594-C-A" -> uint64 (0 if not a pair of SNVs on the same contig within 255bp)
+    try:
+        c1, p1, r1, a1 = snp1.split("-")
+        c2, p2, r2, a2 = snp2.split("-")
+        d = int(p2) - int(p1)
+        if (c1 != c2) or (d <= 0) or (d > 255): return (INVALID)
+        return (np.uint64((CONTIG_CODE[c1] << 44) | (int(p1) << 16) | (BASE_CODE[r1] << 14) | (BASE_CODE[a1] << 12) |
+                          (d << 4) | (BASE_CODE[r2] << 2) | BASE_CODE[a2]))
+    except (ValueError, KeyError, AttributeError):
+        return (INVALID)
+
+def pack_pairs(snp1s, snp2s):
+    #vectorized version of pack_pair, for the release columns (pandas string ops instead of a python loop)
+    s1 = pd.Series(snp1s).str.split("-", expand=True)
+    s2 = pd.Series(snp2s).str.split("-", expand=True)
+    c = s1[0].map(CONTIG_CODE)
+    p1 = pd.to_numeric(s1[1], errors="coerce")
+    d = pd.to_numeric(s2[1], errors="coerce") - p1
+    codes = [s[i].map(BASE_CODE) for s, i in [(s1, 2), (s1, 3), (s2, 2), (s2, 3)]]
+    ok = c.notna() & p1.notna() & (s1[0] == s2[0]) & (d > 0) & (d <= 255)
+    for x in codes: ok &= x.notna()
+    key = np.zeros(len(s1), dtype=np.uint64)
+    f = lambda x: x[ok].astype(np.uint64).values
+    key[ok.values] = ((f(c) << np.uint64(44)) | (f(p1) << np.uint64(16)) | (f(codes[0]) << np.uint64(14)) |
+                      (f(codes[1]) << np.uint64(12)) | (f(d) << np.uint64(4)) | (f(codes[2]) << np.uint64(2)) | f(codes[3]))
+    return (key)
+
+def read_release(path):
+    #tsv (the combined one has quotechar="?") or parquet, only the columns needed for the lookup
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        cols = [c for c in ["snp1", "snp2"] + VALUE_COLUMNS if c in pq.read_schema(path).names]
+        return (pd.read_parquet(path, columns=cols))
+    df = pd.read_csv(path, sep="\t", quotechar="?", dtype=str, usecols=lambda c: c in ["snp1", "snp2"] + VALUE_COLUMNS)
+    for c in COUNT_COLUMNS:
+        if c in df.columns: df[c] = pd.to_numeric(df[c], errors="coerce").astype("Int64")
+    return (df)
+
+
+class MNVIndex(object):
+    def __init__(self, paths):
+        self.paths = list(paths)
+        keys = []
+        vals = []
+        for path in self.paths:
+            df = read_release(path)
+            k = pack_pairs(df.snp1.values, df.snp2.values)
+            df = df.reindex(columns=["snp1", "snp2"] + VALUE_COLUMNS).astype(object)
+            df = df.where(df.notna(), None)
+            df["release"] = os.path.basename(path)
+            keys.append(k[k != INVALID])
+            vals.append(df[k != INVALID])
+        keys = np.concatenate(keys) if len(keys) > 0 else np.zeros(0, dtype=np.uint64)
+        vals = pd.concat(vals) if len(vals) > 0 else pd.DataFrame()
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.records = vals.iloc[order].to_dict("records") #row -> dict, so that a hit does not touch pandas
+        self.loaded_at = time.time()
+
+    def lookup_keys(self, keys):
+        #returns the list of hits (list of records) per key
+        lo = np.searchsorted(self.keys, keys, side="left")
+        hi = np.searchsorted(self.keys, keys, side="right")
+        return ([self.records[l:h] for l, h in zip(lo, hi)])
+
+    def lookup(self, snp1, snp2):
+        return (self.lookup_keys(np.array([pack_pair(snp1, snp2)], dtype=np.uint64))[0])
+
+    def lookup_batch(self, pairs):
+        keys = np.array([pack_pair(s1, s2) for (s1, s2) in pairs], dtype=np.uint64)
+        return (self.lookup_keys(keys))
+
+
+class ReloadingIndex(object):
+    #rebuilds the index in a background thread when a release file changes, and swaps it in when ready
+    def __init__(self, paths, check_interval=10):
+        self.paths = list(paths)
+        self.check_interval = check_interval
+        self._mtimes = self._current_mtimes()
+        self.index = MNVIndex(self.paths)
+        self._last_check = time.time()
+        self._lock = threading.Lock()
+        self._reloading = False
+
+    def _current_mtimes(self):
+        return ([os.path.getmtime(p) if os.path.exists(p) else None for p in self.paths])
+
+    def _reload(self, mtimes):
+        try:
+            index = MNVIndex(self.paths)
+            self.index = index #atomic swap, the old one is still used by the requests in flight
+            self._mtimes = mtimes
+        finally:
+            self._reloading = False
+
+    def get(self):
+        now = time.time()
+        if now - self._last_check > self.check_interval:
+            with self._lock:
+                self._last_check = now
+                mtimes = self._current_mtimes()
+                if (mtimes != self._mtimes) and (None not in mtimes) and (not self._reloading):
+                    self._reloading = True
+                    threading.Thread(target=self._reload, args=(mtimes,), daemon=True).start()
+        return (self.index)
+
+
+def make_handler(reloading_index):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code, obj):
+            body = json.dumps(obj).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urllib.parse.urlparse(self.path)
+            index = reloading_index.get()
+            if url.path == "/health":
+                return (self._send(200, {"n_pairs": int(len(index.keys)), "loaded_at": index.loaded_at, "releases": index.paths}))
+            if url.path == "/lookup":
+                q = urllib.parse.parse_qs(url.query)
+                if ("snp1" not in q) or ("snp2" not in q):
+                    return (self._send(400, {"error": "snp1 and snp2 are required"}))
+                hits = index.lookup(q["snp1"][0], q["snp2"][0])
+                return (self._send(200, {"snp1": q["snp1"][0], "snp2": q["snp2"][0], "is_mnv": len(hits) > 0, "hits": hits}))
+            return (self._send(404, {"error": "not found"}))
+
+        def do_POST(self):
+            if urllib.parse.urlparse(self.path).path != "/lookup":
+                return (self._send(404, {"error": "not found"}))
+            try:
+                pairs = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))["pairs"]
+                if not isinstance(pairs, list): raise ValueError()
+                for x in pairs:
+                    if not (isinstance(x, list) and (len(x) == 2)): raise ValueError()
+            except (ValueError, KeyError, TypeError):
+                return (self._send(400, {"error": "body must be {\"pairs\": [[snp1, snp2], ...]}"}))
+            hits = reloading_index.get().lookup_batch(pairs)
+            return (self._send(200, {"results": [{"snp1": s1, "snp2": s2, "is_mnv": len(h) > 0, "hits": h}
+                                                 for (s1, s2), h in zip(pairs, hits)]}))
+
+        def log_message(self, format, *args):
+            pass #no per request logging (latency)
+    return (Handler)
+
+def serve(port, paths, check_interval=10):
+    server = ThreadingHTTPServer(("", port), make_handler(ReloadingIndex(paths, check_interval)))
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    serve(int(sys.argv[1]), sys.argv[2:])
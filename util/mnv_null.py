@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+__author__ = 'QingboWang'
+
+#null (SNV based) model of dNVs, ratios / fisher tests and count matrix helpers (part of mnv_functions.py).
+#numpy / pandas only (scipy is imported when fisher_OR_and_pval is called). no plotting, no hail.
+
+import numpy as np
+import pandas as pd
+from mnv_classify import revcomp
+from mnv_symmetry import collapsed_ratios, collapse_revcomp_tensor
+
+mut_table = None #SNV mutation rate per 3bp context (from, to, mu_snp), used by prob_dNV_null
+
+def set_mut_table(t):
+    global mut_table
+    mut_table = t
+
+def load_mut_table(path, sep="\t"):
+    set_mut_table(pd.read_csv(path, sep=sep))
+    return (mut_table)
+
+def prob_dNV_null(refspm1b, altspm1b, verbose=False):#probability under the null (independent) model
+    #takes ref2base +- 1base and that of alt
+    if ((refspm1b[0] != altspm1b[0]) | (refspm1b[3] != altspm1b[3]) | (refspm1b[1] == altspm1b[1]) | (refspm1b[2] == altspm1b[2])):
+        return 0 #if not MNV, return 0 (might be better to return NA? but will go on. can mask later.)
+    intm1_4b = refspm1b[0] + altspm1b[1] + refspm1b[2:] #intermediate 1, where ref1-> alt1 already happened
+    intm2_4b = refspm1b[:2] + altspm1b[2] + refspm1b[3] #intermediate 2, where ref2-> alt2 already happened
+    path1 = mut_table.loc[(mut_table["from"]==refspm1b[:3]) & (mut_table["to"]==intm1_4b[:3]), "mu_snp"].values[0] * \
+            mut_table.loc[(mut_table["from"] == intm1_4b[1:]) & (mut_table["to"] == altspm1b[1:]), "mu_snp"].values[0]
+    path2 = mut_table.loc[(mut_table["from"]==refspm1b[1:]) & (mut_table["to"]==intm2_4b[1:]), "mu_snp"].values[0] * \
+            mut_table.loc[(mut_table["from"] == intm2_4b[:3]) & (mut_table["to"] == altspm1b[:3]), "mu_snp"].values[0]
+    if verbose:
+        print("prob. of {0} to {1}\n".format(refspm1b, altspm1b))
+        print("1st path: {0} -> {1} -> {2}\n".format(refspm1b, intm1_4b, altspm1b))
+        print("p1 = p({0}->{1}) * p({2}->{3})\n".format(refspm1b[:3], intm1_4b[:3], intm1_4b[1:], altspm1b[1:]))
+        print("   ={0} * {1} = {2}\n".format((mut_table.loc[(mut_table["from"]==refspm1b[:3]) & (mut_table["to"]==intm1_4b[:3]), "mu_snp"].values[0]), \
+                                             (mut_table.loc[(mut_table["from"] == intm1_4b[1:]) & (mut_table["to"] == altspm1b[1:]), "mu_snp"].values[0]), (path1)))
+        print("2nd path: {0} -> {1} -> {2}\n".format(refspm1b, intm2_4b, altspm1b))
+        print("p2 = p({0}->{1}) * p({2}->{3})\n".format(refspm1b[1:], intm2_4b[1:], intm2_4b[:3], altspm1b[:3]))
+        print("   ={0} * {1} = {2}\n".format((mut_table.loc[(mut_table["from"]==refspm1b[1:]) & (mut_table["to"]==intm2_4b[1:]), "mu_snp"].values[0]), \
+                                             (mut_table.loc[(mut_table["from"] == intm2_4b[:3]) & (mut_table["to"] == altspm1b[:3]), "mu_snp"].values[0]), (path2)))
+        print ("sum of probability = p1 + p2 = {0}".format((path1+path2)))
+    return (path1 + path2)
+
+
+def calc_ratio(afs):
+    if afs[0]=="." or afs[1]==".": return (0)
+    elif float(afs[0])*float(afs[1])==0: return (0)
+    else: return (min(float(afs[1])/float(afs[0]), float(afs[0])/float(afs[1])))
+def log2_adjusted(x):
+    if x==0: return (0) #non significant
+    else: return (np.log2(x))
+def fisher_OR_and_pval(x1, x2, y1, y2): #1 case, 1 alt, 2 case, 2 alt
+    from scipy import stats #only needed here
+    oddsratio, pvalue = stats.fisher_exact([[x1, x2], [y1, y2]])
+    return (oddsratio, pvalue)
+def log2OR_adjusted(OR, P):
+    if P>0.05 / (8**2): return (0) #non significant
+    else: return (log2_adjusted(OR))
+
+def calc_ratio_zeroadjusted(v1,v2):
+    if v2==0: return 0
+    else: return (float(v1)/v2)
+
+def calc_symmetry_and_collapse(crosstab):
+    #one ratio (count / count of the reverse complement pattern) per revcomp pair, named "refs->alts"
+    #(vectorized: mnv_symmetry.collapsed_ratios)
+    return (collapsed_ratios(crosstab))
+
+
+def draw_null_matrix_dnv(obs_refs, cols, cov): 
+    #returns a matrix of probability of each entry, given the number of reference 2bp as obs_refs
+    #and the column names as cols, 
+    #and the coverage as cov
+    null_table = pd.DataFrame(np.zeros([16, 16]))  # just to put the input
+    null_table.columns = cols
+    null_table.index = cols
+    for fourbs in obs_refs.index:
+        tb = pd.DataFrame(np.zeros([16, 16]))  # just to put the input
+        tb.columns = null_table.columns
+        tb.index = null_table.index
+        refs = fourbs[1] + "," + fourbs[2]  # refs, as M,N
+        for alts in tb.columns:
+            fourbs_alt = fourbs[0] + alts[0] + alts[2] + fourbs[3]
+            tb.loc[refs, alts] = prob_dNV_null(fourbs, fourbs_alt)
+        tb = tb * obs_refs[fourbs] * cov.loc[fourbs, "FofC"] #might not need to be squared
+        null_table = null_table + tb
+    return (null_table)
+
+#coverage aware version of draw_null_matrix_dnv.
+#instead of a single FofC per 4bp, takes the 4bp counts stratified by coverage bin
+#(coverage_context.context_counts_by_cov_bin / stratify_4mer_counts), and a detection probability curve.
+#expected = sum over bins of count(4bp, bin) * p_detect(depth of bin)**2 * prob_dNV_null, as a matrix product.
+def detect_step(thres=15):
+    #hard threshold, same as the >15x filter (cov_leq15_reg.bed)
+    return (lambda depth: (np.asarray(depth) > thres).astype(float))
+
+def detect_logistic(mid=15, slope=1.0):
+    return (lambda depth: 1.0 / (1.0 + np.exp(-slope * (np.asarray(depth, dtype=float) - mid))))
+
+def null_prob_per_context(fourbs_list, cols):
+    #prob_dNV_null for every 4bp x alts, calculated once (does not depend on the coverage)
+    #returns (row index of refs in cols per 4bp, array of probability (n 4bp, len(cols)))
+    rows = []
+    probs = np.zeros([len(fourbs_list), len(cols)])
+    for i, fourbs in enumerate(fourbs_list):
+        rows.append(list(cols).index(fourbs[1] + "," + fourbs[2]))  # refs, as M,N
+        for j, alts in enumerate(cols):
+            probs[i, j] = prob_dNV_null(fourbs, fourbs[0] + alts[0] + alts[2] + fourbs[3])
+    return (np.array(rows), probs)
+
+def draw_null_matrix_dnv_cov(ctx_cnts_by_bin, cols, detect_prob=detect_step(15), bin_depth=None, null_probs=None):
+    #ctx_cnts_by_bin: dataframe, index = 4bp, columns = coverage bins (lower edge, used as the depth unless bin_depth is given)
+    #detect_prob: function depth -> probability of detecting a SNV at that depth (applied to both SNVs)
+    #null_probs: output of null_prob_per_context for ctx_cnts_by_bin.index, to skip re-calculation when the curve changes
+    if bin_depth is None: bin_depth = np.array(ctx_cnts_by_bin.columns, dtype=float)
+    if null_probs is None: null_probs = null_prob_per_context(ctx_cnts_by_bin.index, cols)
+    rows, probs = null_probs
+    w = ctx_cnts_by_bin.values.dot(detect_prob(bin_depth) ** 2) #effective number of 4bp, per 4bp
+    null_table = np.zeros([len(cols), len(cols)])
+    np.add.at(null_table, rows, probs * w[:, None])
+    return (pd.DataFrame(null_table, index=cols, columns=cols))
+
+def collapse_crstb_to_revcomp(crstb, drop_trivial=False):
+    # collaspse to a table, instead of another matrix
+    # each (refs, alts) is summed with its reverse complement, and kept under the label that comes first in the table
+    # (same output as the row by row version, but with a single lookup of the revcomp index per row)
+    # drop_trivial=True: delete the ones where refs and alts share a base (as in density_per_func_annot.py), instead of the zero ones
+    flt = crstb.stack().reset_index()
+    flt.columns = ['refs', 'alts', 'cnt']
+    ix = pd.Series(range(flt.shape[0]), index=pd.MultiIndex.from_arrays([flt.refs, flt.alts]))
+    ix = ix[~ix.index.duplicated()]
+    rc = {x: revcomp(x) for x in set(flt.refs) | set(flt.alts)}
+    ix_revcomp = ix.reindex(pd.MultiIndex.from_arrays([flt.refs.map(rc), flt.alts.map(rc)])).values
+    ix_self = np.arange(flt.shape[0])
+    ix_revcomp = np.where(np.isnan(ix_revcomp), ix_self, ix_revcomp).astype(int)
+    cnt = flt.cnt.values
+    flt["cnt"] = np.where(ix_revcomp != ix_self, cnt + cnt[ix_revcomp], cnt)
+    flt = flt[ix_self <= ix_revcomp]
+    if drop_trivial: flt = flt[(flt.refs.str[0]!=flt.alts.str[0])&(flt.refs.str[1]!=flt.alts.str[1])]  # deleting trivial ones
+    else: flt = flt[flt.cnt > 0]  # deleting the no dNVs
+    flt.reset_index(inplace=True)
+    del flt["index"]
+    return (flt)
+
+def stratum_fractions(x, labels, dists, stratum=0):
+    #x: (n_strata, n_dists, n, n) count tensor (tsv_loader.cnt_tensor, e.g. strata [onestep, not onestep]).
+    #fraction of the stratum among all the MNVs, per distance and (revcomp collapsed) pattern, and in total ("all"),
+    #with the standard error of the mean sqrt(f * (1 - f) / n) as in global_mechanisms.ipynb
+    (refs, alts, cnt) = collapse_revcomp_tensor(x, labels) #(n_strata, n_dists, n_pairs)
+    k = cnt[stratum]
+    n = cnt.sum(axis=0)
+    dfs = []
+    for (i, d) in enumerate(dists):
+        ix = [r[0] + "N" * (d - 1) + r[1:] + "->" + a[0] + "N" * (d - 1) + a[1:] for (r, a) in zip(refs, alts)] + ["all"]
+        dfs.append(pd.DataFrame({"dist": d, "pattern": ix, "cnt": np.append(k[i], k[i].sum()), "total": np.append(n[i], n[i].sum())}))
+    df = pd.concat(dfs, ignore_index=True)
+    df = df[df.total > 0].reset_index(drop=True)
+    df["frac"] = df.cnt / df.total
+    df["sem"] = np.sqrt(df.frac * (1 - df.frac) / df.total)
+    return (df)
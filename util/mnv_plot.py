@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+__author__ = 'QingboWang'
+
+#heatmaps of the count matrices (part of mnv_functions.py). loaded on demand by mnv_functions.
+#each call computes its matrix and renders it right away through mnv_report (Agg, figure closed, not re-rendered if
+#the png is from the same matrix). to render many of them off the compute path, queue them in a mnv_report.Report.
+
+from mnv_symmetry import ratio_matrix
+from mnv_report import heatmap_job, fisher_job, ratio_job, symmetry_job, render_jobs
+
+def draw_heatmap(crstb, title, outdir, num_style="d"):
+    render_jobs([heatmap_job(crstb, title, outdir, num_style)], n_workers=1)
+
+def plot_heatmap_fisher(table1, table2, title, dir, only_signif=True): #16x16 tables.
+    #odds ratio for each entry of the table
+    #if mask=True: mask all the non significant ones
+    render_jobs([fisher_job(table1, table2, title, dir, only_signif)], n_workers=1)
+
+def plot_heatmap_ratio(table1, table2, title, dir): #16x16 tables.
+    #the ratio of table2 compare to table1, for each cell entry
+    render_jobs([ratio_job(table1, table2, title, dir)], n_workers=1)
+
+def calc_symmetry(crosstab, out_dir=None):
+    #calculate how symmetric they are, return as the ratio(that are closer to one)
+    #(0 if revcomp is yourself. vectorized: mnv_symmetry.ratio_matrix). plotted only if out_dir is given
+    sym = ratio_matrix(crosstab)
+    if out_dir is not None:
+        draw_symmetry(sym, out_dir)
+    return (sym)
+
+def draw_symmetry(sym, out_dir):
+    render_jobs([symmetry_job(sym, out_dir)], n_workers=1)
+    #and finally return the matrix itself
+    return (sym)
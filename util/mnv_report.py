@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+__author__ = 'QingboWang'
+
+#heatmap rendering as a separate (reporting) stage: the analysis computes the matrices and queues them as Heatmap
+#jobs (data only: matrix, mask, title, format, output path), the report renders them all at the end,
+#in a process pool (Agg backend in the workers, one Figure per job, closed after saving).
+#a job whose input (matrix, mask, title, style) has the same hash as the last time its png was written is skipped:
+#the hash is kept next to the png (out_path + ".sha1").
+#  rep = Report()
+#  for d in range(1, 11): rep.heatmap(cnt[d], "d={0}".format(d), "cnt_mat_d{0}.png".format(d))
+#  rep.fisher(t1, t2, "coding vs all", "fisher.png")
+#  rep.render(n_workers=8)   #-> {"rendered": .., "skipped": ..}
+#matplotlib / seaborn are only imported where the figures are drawn (render_heatmap).
+
+import hashlib
+import json
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from mnv_null import fisher_OR_and_pval, log2_adjusted, calc_ratio_zeroadjusted
+
+FIGSIZE = (10, 10)
+DPI = 300
+RENDER_VERSION = 1 #bump when the drawing changes, so that everything is re-rendered
+
+Heatmap = namedtuple("Heatmap", ["matrix", "mask", "title", "out_path", "fmt", "cbar_label", "linecolor"])
+
+
+#jobs (no matplotlib)
+def heatmap_job(crstb, title, out_path, num_style="d"):
+    return (Heatmap(crstb, crstb == 0, title, out_path, num_style, None, "black"))
+
+def fisher_matrix(table1, table2):
+    #log2(OR) and p value of each entry of table1 vs table2 (fisher test against the totals)
+    out = table1.astype(float)
+    pval_table = table1.astype(float)
+    X2 = sum(table1.sum(axis=0)) #=x2
+    Y2 = sum(table2.sum(axis=0)) #=y2
+    for i in range(table1.shape[0]):
+        for j in range(table1.shape[1]):
+            (OR, P) = fisher_OR_and_pval(table1.iloc[i,j], X2, table2.iloc[i,j], Y2)
+            out.iloc[i,j] = log2_adjusted(OR)
+            pval_table.iloc[i, j] = P
+    return ((out, pval_table))
+
+def fisher_job(table1, table2, title, out_path, only_signif=True):
+    #only_signif: mask the ones not significant after Bonferroni (16x9 tests), otherwise the zero ones
+    (out, pval_table) = fisher_matrix(table1, table2)
+    mask = (pval_table > 0.05/(16*9)) if only_signif else (out == 0)
+    title = "{0} \n n= {1}, {2}".format(title, sum(table1.sum(axis=0)), sum(table2.sum(axis=0)))
+    return (Heatmap(out, mask, title, out_path, ".2f", "log2(OR)", "black"))
+
+def ratio_job(table1, table2, title, out_path):
+    #the ratio of table2 compare to table1, for each cell entry
+    out = table1.astype(float)
+    for i in range(table1.shape[0]):
+        for j in range(table1.shape[1]):
+            out.iloc[i,j] = calc_ratio_zeroadjusted(table1.iloc[i,j],table2.iloc[i,j])
+    title = "{0} \n n= {1}, {2}".format(title, sum(table1.sum(axis=0)), sum(table2.sum(axis=0)))
+    return (Heatmap(out, out == 0, title, out_path, ".2f", "fraction", "black"))
+
+def symmetry_job(sym, out_path):
+    #sym: mnv_symmetry.ratio_matrix
+    return (Heatmap(sym, sym == 0, "number of MNV divided by \n that of its complementary pattern", out_path, ".2g", None, "white"))
+
+
+#hash / render
+def job_hash(job):
+    h = hashlib.sha1()
+    h.update(json.dumps([RENDER_VERSION, job.title, job.fmt, job.cbar_label, job.linecolor, FIGSIZE, DPI]).encode())
+    for x in [job.matrix, job.mask]:
+        h.update(x.to_csv().encode())
+    return (h.hexdigest())
+
+def hash_path(out_path):
+    return (out_path + ".sha1")
+
+def is_current(job, h=None):
+    #png there and rendered from the same input
+    if not (os.path.exists(job.out_path) and os.path.exists(hash_path(job.out_path))): return (False)
+    with open(hash_path(job.out_path)) as f:
+        return (f.read().strip() == (job_hash(job) if h is None else h))
+
+def render_heatmap(job):
+    #draws one job to its out_path. a Figure of its own (not pyplot's), so nothing is kept after the return
+    from matplotlib.figure import Figure
+    import seaborn as sns
+    fig = Figure(figsize=FIGSIZE)
+    ax = fig.subplots()
+    ax.set_aspect('equal')
+    kw = {} if job.cbar_label is None else {"cbar_kws": {"label": job.cbar_label}}
+    sns.heatmap(job.matrix, linewidths=.5, annot=True, fmt=job.fmt, mask=job.mask, linecolor=job.linecolor, ax=ax, **kw)
+    ax.set_title(job.title)
+    ax.set_yticklabels(ax.get_yticklabels(), rotation=0)
+    fig.savefig(job.out_path, dpi=DPI)
+    fig.clf()
+    return (job.out_path)
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use("Agg")
+
+def _render_and_hash(args):
+    (job, h) = args
+    render_heatmap(job)
+    with open(hash_path(job.out_path), "w") as f:
+        f.write(h + "\n")
+    return (job.out_path)
+
+def render_jobs(jobs, n_workers=4, force=False):
+    #renders the jobs that are not current (all of them with force=True). n_workers <= 1: in this process
+    todo = []
+    for job in jobs:
+        h = job_hash(job)
+        if force or not is_current(job, h):
+            todo.append((job, h))
+    if (n_workers <= 1) or (len(todo) <= 1):
+        done = [_render_and_hash(x) for x in todo]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker) as ex:
+            done = list(ex.map(_render_and_hash, todo))
+    return ({"rendered": len(done), "skipped": len(jobs) - len(done), "paths": done})
+
+
+class Report(object):
+    #queue of heatmaps, rendered together by render()
+    def __init__(self):
+        self.jobs = []
+
+    def add(self, job):
+        self.jobs.append(job)
+        return (job)
+
+    def heatmap(self, crstb, title, out_path, num_style="d"):
+        return (self.add(heatmap_job(crstb, title, out_path, num_style)))
+
+    def fisher(self, table1, table2, title, out_path, only_signif=True):
+        return (self.add(fisher_job(table1, table2, title, out_path, only_signif)))
+
+    def ratio(self, table1, table2, title, out_path):
+        return (self.add(ratio_job(table1, table2, title, out_path)))
+
+    def symmetry(self, sym, out_path):
+        return (self.add(symmetry_job(sym, out_path)))
+
+    def render(self, n_workers=4, force=False):
+        stats = render_jobs(self.jobs, n_workers, force)
+        self.jobs = []
+        print ("[report] {0} heatmaps rendered, {1} unchanged".format(stats["rendered"], stats["skipped"]))
+        return (stats)
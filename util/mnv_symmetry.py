@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+__author__ = 'QingboWang'
+
+#strand symmetry of count matrices (refs x alts): count of each MNV pattern / count of its reverse complement pattern.
+#instead of a loop over the cells with a revcomp + .loc lookup per cell, the reverse complement of the labels is
+#a permutation of the rows / columns (computed once per label set, arithmetically for the full k-mer sets), so the ratio matrix is
+#  counts / counts[rc_rows][:, rc_cols]
+#for any number of distances at once (a stack of matrices with the same labels).
+#  ratio_matrix(crosstab)      #= mnv_plot.calc_symmetry without the plot (0 where the pattern is its own revcomp)
+#  collapsed_ratios(crosstab)  #= mnv_null.calc_symmetry_and_collapse (one ratio per revcomp pair, "refs->alts")
+#  symmetry_all({d: crosstab}) #all the distances: ratio matrices + the collapsed series as columns
+#  collapse_revcomp_tensor(x, labels)  #collapse_crstb_to_revcomp (without dropping the zeros) of a whole count tensor
+#no Biopython, no plotting here (plot_ratio_matrix imports mnv_plot when asked).
+
+import numpy as np
+import pandas as pd
+from mnv_classify import revcomp
+
+BASES = "ACGT"
+_permutations = {}
+
+
+def kmer_labels(k, sep=""):
+    #the 4^k k-mers, in lexicographic order (sep between the bases, e.g. "," for the "M,N" labels)
+    labels = [""]
+    for _ in range(k):
+        labels = [x + b for x in labels for b in BASES]
+    return ([sep.join(x) for x in labels])
+
+def kmer_revcomp_permutation(k):
+    #for the kmer_labels(k) order: index of the reverse complement (digits in base 4, reversed and complemented)
+    idx = np.arange(4 ** k)
+    digits = (idx[:, None] // (4 ** np.arange(k)[::-1])) % 4 #most significant first
+    return ((3 - digits[:, ::-1]) @ (4 ** np.arange(k)[::-1]))
+
+def revcomp_permutation(labels):
+    #position of the reverse complement of each label (-1 if it is not among the labels). cached per label set
+    key = tuple(labels)
+    if key not in _permutations:
+        k = len(key[0]) if (len(key) > 0) and isinstance(key[0], str) else -1
+        if (k > 0) and (len(key) == 4 ** k) and (list(key) == kmer_labels(k)): #all the k-mers in order (16 x 16 matrices etc.)
+            _permutations[key] = kmer_revcomp_permutation(k)
+        else:
+            pos = {x: i for (i, x) in enumerate(key)}
+            _permutations[key] = np.array([pos.get(revcomp(x), -1) for x in key])
+    return (_permutations[key])
+
+def _take(values, rows, cols):
+    #values[..., rows, :][..., :, cols], nan where the revcomp label is missing
+    out = values[..., np.maximum(rows, 0), :][..., np.maximum(cols, 0)].astype(float)
+    out[..., rows < 0, :] = np.nan
+    out[..., :, cols < 0] = np.nan
+    return (out)
+
+def ratio_tensor(values, rows, cols):
+    #values: (..., n_refs, n_alts). count / revcomp count, 0 for the cells that are their own revcomp
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = values / _take(values, rows, cols)
+    self_rc = (rows == np.arange(len(rows)))[:, None] & (cols == np.arange(len(cols)))[None, :]
+    ratio[..., self_rc] = 0
+    return (ratio)
+
+def ratio_matrix(crosstab):
+    rows = revcomp_permutation(list(crosstab.index))
+    cols = revcomp_permutation(list(crosstab.columns))
+    return (pd.DataFrame(ratio_tensor(crosstab.values.astype(float), rows, cols), index=crosstab.index, columns=crosstab.columns))
+
+def collapse_mask(values, rows, cols):
+    #cells kept in the collapsed series: non zero, and not the revcomp of a (non zero) cell before them (row major)
+    (n_r, n_c) = values.shape[-2:]
+    flat = np.arange(n_r * n_c).reshape(n_r, n_c)
+    partner = np.where((rows[:, None] >= 0) & (cols[None, :] >= 0), rows[:, None] * n_c + cols[None, :], -1)
+    nz = values != 0
+    nz_partner = np.where(partner >= 0, nz.reshape(values.shape[:-2] + (-1,))[..., np.maximum(partner, 0)], False)
+    return (nz & ~(nz_partner & (partner < flat)))
+
+def collapsed_ratios(crosstab):
+    rows = revcomp_permutation(list(crosstab.index))
+    cols = revcomp_permutation(list(crosstab.columns))
+    values = crosstab.values.astype(float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = values / _take(values, rows, cols)
+    keep = collapse_mask(values, rows, cols)
+    (i, j) = np.nonzero(keep)
+    names = [str(r) + "->" + str(a) for (r, a) in zip(crosstab.index[i], crosstab.columns[j])]
+    return (pd.Series(ratio[i, j], index=names))
+
+def collapse_revcomp_tensor(x, labels):
+    #x: (..., n, n) counts, labels of the rows and columns. each (refs, alts) summed with its reverse complement, under
+    #the label that comes first (row major), as collapse_crstb_to_revcomp does for one matrix, but for a whole tensor.
+    #-> (refs, alts, (..., n_pairs) counts)
+    p = revcomp_permutation(list(labels))
+    p = np.where(p < 0, np.arange(len(p)), p) #no revcomp label: on its own
+    n = len(labels)
+    flat = np.arange(n * n).reshape(n, n)
+    partner = p[:, None] * n + p[None, :]
+    summed = np.where(partner != flat, x + x[..., p, :][..., :, p], x)
+    (i, j) = np.nonzero(flat <= partner)
+    return ((np.asarray(labels)[i], np.asarray(labels)[j], summed[..., i, j]))
+
+def symmetry_all(crosstabs):
+    #crosstabs: {d: count matrix}. -> ({d: ratio matrix}, DataFrame of the collapsed ratios, one column per d)
+    #matrices with the same labels (same permutations) are computed as one (n_d, n_refs, n_alts) stack
+    ds = list(crosstabs)
+    ratios = {}
+    groups = {}
+    for d in ds:
+        c = crosstabs[d]
+        key = (tuple(revcomp_permutation(list(c.index))), tuple(revcomp_permutation(list(c.columns))))
+        groups.setdefault(key, []).append(d)
+    for ((rows, cols), group) in groups.items():
+        stack = np.stack([crosstabs[d].values.astype(float) for d in group])
+        r = ratio_tensor(stack, np.array(rows), np.array(cols))
+        for (k, d) in enumerate(group):
+            ratios[d] = pd.DataFrame(r[k], index=crosstabs[d].index, columns=crosstabs[d].columns)
+    collapsed = pd.concat([collapsed_ratios(crosstabs[d]).rename(d) for d in ds], axis=1)
+    return ((ratios, collapsed))
+
+def plot_ratio_matrix(sym, out_path):
+    import mnv_plot #matplotlib / seaborn only when a plot is asked for
+    return (mnv_plot.draw_symmetry(sym, out_path))
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+__author__ = 'QingboWang'
+
+#partition layout from the size of a stage's input, instead of the repartition(1000) / repartition(40) /
+#repartition(4, shuffle=False) tuned by hand per script:
+#  t = plan_partitions(t, "entries", contig=chr)   #repartitions (or not), and logs the decision
+#- rows: given, or estimated from a few evenly spaced partitions (SAMPLE_PARTITIONS), x bytes per row (per profile)
+#- wanted partitions = rows * row_bytes / target_bytes (and rows / target_rows), clamped to the profile min / max
+#- within KEEP_RANGE of the current number: kept as is. fewer: naive coalesce (no shuffle, neighbouring partitions
+#  merged, order kept). more: shuffle (a coalesce can't split partitions)
+#decisions: one json line per call in $MNV_PARTITION_LOG (default mnv_partitions.jsonl) + a print.
+#each call without n_rows runs a hail job (the sampled count), which evaluates the whole upstream of t on the sampled
+#partitions, and that work is done again by the action that follows. so: plan on a table that was just read or is
+#persisted / checkpointed, or pass n_rows. estimate_counts gets the rows of several filters of one table in one job:
+#  n = estimate_counts(et, "cls")  #{"het": .., "hom_hom": ..}
+#  et_het = plan_partitions(et.filter(et.cls == "het"), "entries", n_rows=n.get("het", 0))
+
+import json
+import math
+import os
+import time as tm
+from collections import namedtuple
+
+#target_bytes / target_rows per partition, bytes per row, min / max number of partitions, per kind of stage
+PROFILES = {"default": dict(target_bytes=128e6, target_rows=None, row_bytes=200, min_partitions=1, max_partitions=10000),
+            #variants x samples rows (window_by_locus input), per row all the entries of the samples
+            "variants": dict(target_bytes=256e6, target_rows=None, row_bytes=20000, min_partitions=1, max_partitions=10000),
+            #exploded entry pairs going into the per variant group_by
+            "entries": dict(target_bytes=128e6, target_rows=None, row_bytes=400, min_partitions=1, max_partitions=10000),
+            #MNV tables going into a group_by (count matrices)
+            "mnv": dict(target_bytes=64e6, target_rows=None, row_bytes=300, min_partitions=1, max_partitions=2000),
+            #one file per partition when exported: few, large ones
+            "export": dict(target_bytes=1e9, target_rows=None, row_bytes=150, min_partitions=1, max_partitions=200),
+            #VEP: one VEP process per partition, start up cost + memory -> few rows per partition, few partitions
+            "vep": dict(target_bytes=None, target_rows=20000, row_bytes=300, min_partitions=1, max_partitions=16)}
+KEEP_RANGE = (0.5, 2.0) #current / wanted in this range: no repartition
+SAMPLE_PARTITIONS = 8
+
+PartitionPlan = namedtuple("PartitionPlan", ["n_partitions", "action", "shuffle", "n_rows", "est_bytes", "current"])
+
+
+def log_path():
+    return (os.environ.get("MNV_PARTITION_LOG", "mnv_partitions.jsonl"))
+
+def n_partitions_of(t):
+    return (t.n_partitions())
+
+def count(t):
+    return (t.count_rows() if hasattr(t, "count_rows") else t.count())
+
+def sample_partitions(t, n_sample=SAMPLE_PARTITIONS):
+    #(t itself if it has few partitions, otherwise n_sample evenly spaced partitions of it, scale to the whole of t)
+    #hail has no public way to read some partitions only: _filter_partitions (hail 0.2 Table / MatrixTable) is used
+    #if it is there, otherwise the whole of t is counted (exact, but all the partitions are evaluated)
+    n = n_partitions_of(t)
+    if (n <= n_sample) or not hasattr(t, "_filter_partitions"):
+        return ((t, 1.0))
+    idx = sorted(set([int(i * n / n_sample) for i in range(n_sample)]))
+    return ((t._filter_partitions(idx), float(n) / len(idx)))
+
+def estimate_rows(t, n_sample=SAMPLE_PARTITIONS):
+    #rows of a (matrix) table: counted exactly if it has few partitions, otherwise counted on n_sample evenly spaced
+    #partitions and scaled (only those partitions are evaluated). one job
+    (ts, scale) = sample_partitions(t, n_sample)
+    return (int(round(count(ts) * scale)))
+
+def estimate_counts(t, field, n_sample=SAMPLE_PARTITIONS):
+    #rows of a table per value of t[field] (e.g. a class), estimated as estimate_rows does, in one job for all the values
+    import hail as hl
+    (ts, scale) = sample_partitions(t, n_sample)
+    return ({k: int(round(v * scale)) for (k, v) in ts.aggregate(hl.agg.counter(ts[field])).items()})
+
+def wanted_partitions(n_rows, profile="default", row_bytes=None):
+    p = PROFILES[profile]
+    row_bytes = p["row_bytes"] if row_bytes is None else row_bytes
+    want = 1
+    if p["target_bytes"] is not None:
+        want = max(want, int(math.ceil(n_rows * row_bytes / p["target_bytes"])))
+    if p["target_rows"] is not None:
+        want = max(want, int(math.ceil(float(n_rows) / p["target_rows"])))
+    return (min(max(want, p["min_partitions"]), p["max_partitions"]))
+
+def plan(n_rows, current, profile="default", row_bytes=None):
+    #the decision only (numbers in, PartitionPlan out)
+    row_bytes = PROFILES[profile]["row_bytes"] if row_bytes is None else row_bytes
+    want = wanted_partitions(n_rows, profile, row_bytes)
+    if KEEP_RANGE[0] <= float(current) / want <= KEEP_RANGE[1]:
+        (action, want) = ("keep", current)
+    elif want < current:
+        action = "coalesce"
+    else:
+        action = "shuffle"
+    return (PartitionPlan(want, action, action == "shuffle", int(n_rows), int(n_rows * row_bytes), int(current)))
+
+def apply_plan(t, p):
+    if p.action == "coalesce":
+        return (t.naive_coalesce(p.n_partitions))
+    if p.action == "shuffle":
+        return (t.repartition(p.n_partitions, shuffle=True))
+    return (t)
+
+def log_plan(p, stage, **fields):
+    rec = dict(stage=stage, time=tm.strftime("%Y-%m-%dT%H:%M:%S"), **fields)
+    rec.update(p._asdict())
+    with open(log_path(), "a") as f:
+        f.write(json.dumps(rec) + "\n")
+    print ("[partitions] {0}: {1} rows (~{2:.0f}MB) in {3} partitions -> {4} {5}".format(
+        " ".join([stage] + ["{0}={1}".format(k, v) for (k, v) in fields.items()]), p.n_rows, p.est_bytes / 1e6, p.current,
+        p.action, p.n_partitions))
+
+def plan_partitions(t, profile="default", n_rows=None, row_bytes=None, stage=None, **fields):
+    #repartitioned (or not) t. n_rows: if known (e.g. counted upstream), otherwise estimated (a job, see above)
+    #fields (contig, dist, ..) only go to the log
+    current = n_partitions_of(t)
+    if n_rows is None: n_rows = estimate_rows(t)
+    p = plan(n_rows, current, profile, row_bytes)
+    log_plan(p, profile if stage is None else stage, **fields)
+    return (apply_plan(t, p))
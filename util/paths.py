@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+__author__ = 'QingboWang'
+
+#mapping of the original gs:// paths to local copies (test fixtures, on-prem mirror), shared by resources.py and
+#storage.py (no hail needed here), either by the environment variable
+#  MNV_PATH_MAP="gs://gnomad/=/data/gnomad/;gs://gnomad-qingbowang/=/data/mnv/"
+#or by add_path_mapping("gs://gnomad/", "/data/gnomad/") / set_path_resolver(function), and read through resolve_path(path).
+
+import os
+
+
+_path_mappings = []
+_path_resolver = None
+
+def add_path_mapping(prefix, local_prefix):
+    #the longest matching prefix wins
+    _path_mappings.append((prefix, local_prefix))
+    _path_mappings.sort(key=lambda x: -len(x[0]))
+
+def set_path_resolver(resolver):
+    #resolver: function path -> path. None to go back to the prefix mappings
+    global _path_resolver
+    _path_resolver = resolver
+
+def _load_env_mappings():
+    for m in os.environ.get("MNV_PATH_MAP", "").split(";"):
+        if "=" in m:
+            (prefix, local_prefix) = m.split("=", 1)
+            add_path_mapping(prefix, local_prefix)
+
+def resolve_path(path):
+    if _path_resolver is not None: return (_path_resolver(path))
+    for (prefix, local_prefix) in _path_mappings:
+        if path.startswith(prefix):
+            return (local_prefix + path[len(prefix):])
+    return (path)
+
+def is_remote(path):
+    #gs://, hdfs:// etc. (after resolve_path): read through hadoop, anything else is a local path
+    return ("://" in path) and not path.startswith("file://")
+
+_load_env_mappings()
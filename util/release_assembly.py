@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+__author__ = 'QingboWang'
+
+#assembly of the coding MNV release (combined exome + genome, exome only, genome only) from the per chromosome
+#VEP consequence tables (v2_consequence_{exome,genome}_chr{N}_d{1,2}.tsv, output of annotate_vep_mnv.py).
+#- per chromosome tables read in parallel, typed (tsv_loader.CONSEQUENCE_SCHEMA)
+#- consequence / categ computed once per distinct value (the same cons_term strings and aa changes repeat a lot)
+#- exome and genome joined by one keyed outer merge, shared annotation coalesced (exome first, as in the release)
+#- combined / exome / genome releases from the same frame, sorted by contig, position, mnv, transcript_id
+#- check_release: row counts and consistency of the counts, before anything is written
+#(used in code/mnv_coding_parse.py)
+
+import os
+import numpy as np
+import pandas as pd
+from mnv_classify import cons_term_most_severe, mnv_category
+from release_io import CONTIGS, SORT_KEY, parse_filter, write_release_parquet
+from tsv_loader import CONSEQUENCE_SCHEMA, expand_pattern, load_tsvs
+
+MERGE_KEY = ["locus.contig", "locus.position", "refs", "alts", "transcript_id"]
+RELEASE_KEY = ["mnv", "transcript_id"]
+COUNT_COLUMNS = ["AC_mnv", "n_homhom", "n_indv"]
+ANNOT_COLUMNS = ['locus.position', "locus.contig", 'transcript_id', 'categ', "snp1", "snp2", "mnv",
+                 'snp1_consequence', 'snp2_consequence', 'mnv_consequence',
+                 "snp1_codons", "snp2_codons", "mnv_codons",
+                 "snp1_amino_acids", "snp2_amino_acids", "mnv_amino_acids",
+                 'snp1_lof', 'snp2_lof', 'mnv_lof']
+SNP_AC_COLUMNS = ["AC_snp1", "AC_snp1_ex", "AC_snp1_gen", "AC_snp2", "AC_snp2_ex", "AC_snp2_gen"]
+FILTER_COLUMNS = ["filter_snp1_ex", "filter_snp1_gen", "filter_snp2_ex", "filter_snp2_gen"]
+RELEASE_COLUMNS = ANNOT_COLUMNS + ["n_indv", 'AC_mnv', 'n_homhom', "n_indv_ex", 'AC_mnv_ex', 'n_homhom_ex',
+                                   "n_indv_gen", 'AC_mnv_gen', 'n_homhom_gen'] + SNP_AC_COLUMNS + FILTER_COLUMNS
+EXOME_COLUMNS = ANNOT_COLUMNS + ["n_indv_ex", 'AC_mnv_ex', 'n_homhom_ex', "AC_snp1_ex", "AC_snp2_ex"]
+GENOME_COLUMNS = ANNOT_COLUMNS + ["n_indv_gen", 'AC_mnv_gen', 'n_homhom_gen', "AC_snp1_gen", "AC_snp2_gen"]
+CONSEQUENCE_PATH = "~/Downloads/v2_consequence_{0}_chr{1}_d{2}.tsv"
+
+
+def read_consequence_tables(data_type, path_fmt=CONSEQUENCE_PATH, ds=(1, 2), n_workers=8):
+    #data_type = "exome" or "genome" (no chrY in the genome). concatenated in (d, chr) order
+    chrs = CONTIGS if data_type == "exome" else [c for c in CONTIGS if c != "Y"]
+    files = [path_fmt.format(data_type, chr, d) for d in ds for chr in chrs]
+    return (load_tsvs(files, CONSEQUENCE_SCHEMA, n_workers=n_workers))
+
+def lower_mnv_codons(codons):
+    #d=2: the middle (unchanged) base of the codon is lower case in the snp codons, but not in the mnv codons from VEP
+    #e.g. "ACG/TCA" -> "AcG/TcA"
+    return (codons.str[0] + codons.str[1].str.lower() + codons.str[2:5] + codons.str[5].str.lower() + codons.str[6:])
+
+def annotate_consequence(df):
+    #most severe consequence of snp1 / snp2 / mnv, and the categ. each distinct value is computed once
+    for c in ["snp1", "snp2", "mnv"]:
+        terms = df[c + "_cons_term"]
+        u = terms.dropna().unique()
+        df[c + "_consequence"] = terms.map(dict(zip(u, [cons_term_most_severe(x) for x in u])))
+    cols = ["snp1_consequence", "snp2_consequence", "mnv_consequence", "snp1_amino_acids", "snp2_amino_acids", "mnv_amino_acids"]
+    u = df[cols].drop_duplicates()
+    u["categ"] = [mnv_category(*x) for x in u.itertuples(index=False, name=None)]
+    df = df.drop(columns=["categ"], errors="ignore").merge(u, on=cols, how="left", sort=False)
+    return (df.drop(columns=["snp1_cons_term", "snp2_cons_term", "mnv_cons_term"]))
+
+def prepare(df, suffix):
+    #one data type, d=1 and d=2 together. counts renamed with _ex / _gen
+    df = df.copy()
+    is_d2 = df.refs.str.len() == 3
+    df.loc[is_d2, "mnv_codons"] = lower_mnv_codons(df.loc[is_d2, "mnv_codons"])
+    df = annotate_consequence(df)
+    df["n_indv"] = df.AC_mnv - df.n_homhom
+    df = df.drop(columns=["AC", "prev_AC"], errors="ignore")
+    return (df.rename(columns={c: c + suffix for c in COUNT_COLUMNS}))
+
+def assemble_release(dfe, dfg):
+    #dfe, dfg: concatenated consequence tables (read_consequence_tables) of the exome / genome
+    dfe = prepare(dfe, "_ex")
+    dfg = prepare(dfg, "_gen")
+    t = dfe.merge(dfg, on=MERGE_KEY, how="outer", suffixes=("", "_g"), indicator=True, sort=False)
+    only_gen = (t._merge == "right_only").values
+    for c in [c for c in dfe.columns if (c + "_g") in t.columns]: #shared annotation: exome, or genome if not in the exome
+        t[c] = np.where(only_gen, t[c + "_g"], t[c])
+        del t[c + "_g"]
+    del t["_merge"]
+    for c in [c + s for c in COUNT_COLUMNS for s in ["_ex", "_gen"]]:
+        t[c] = t[c].fillna(0).astype(np.int64)
+    t["locus.position"] = t["locus.position"].astype(np.int64)
+    for c in COUNT_COLUMNS:
+        t[c] = t[c + "_ex"] + t[c + "_gen"]
+
+    #columns for the browser
+    contig = t["locus.contig"].astype(str)
+    t["snp1"] = contig + "-" + t["locus.position"].astype(str) + "-" + t.refs.str[0] + "-" + t.alts.str[0]
+    t["snp2"] = (contig + "-" + (t["locus.position"] + t.refs.str.len() - 1).astype(str) + "-" +
+                 t.refs.str[-1] + "-" + t.alts.str[-1])
+    t["mnv"] = contig + "-" + t["locus.position"].astype(str) + "-" + t.refs + "-" + t.alts
+    t = sort_release(t)
+    check_release(t, len(dfe), len(dfg))
+    return (t)
+
+def sort_release(t):
+    #contig in 1..22, X, Y order (not as string), then position, mnv, transcript_id. stable -> deterministic
+    rank = pd.Categorical(t["locus.contig"].astype(str), categories=CONTIGS, ordered=True).codes
+    t = t.assign(_rank=rank).sort_values(by=["_rank"] + SORT_KEY[1:], kind="mergesort")
+    return (t.drop(columns=["_rank"]).reset_index(drop=True))
+
+def annotate_release(t, annot, columns):
+    #add per MNV columns computed elsewhere (e.g. AC_snp* and filter_snp* annotated in hail), joined by mnv, transcript_id
+    #(not by the row order)
+    annot = annot[RELEASE_KEY + columns].drop_duplicates(subset=RELEASE_KEY)
+    n = len(t)
+    t = t.drop(columns=[c for c in columns if c in t.columns]).merge(annot, on=RELEASE_KEY, how="left", sort=False)
+    if len(t) != n:
+        raise ValueError("annotation changed the number of rows: {0} -> {1}".format(n, len(t)))
+    if "AC_snp1_ex" in t.columns: #NaN = the SNV is not in that data type
+        for c in ["AC_snp1_ex", "AC_snp1_gen", "AC_snp2_ex", "AC_snp2_gen"]:
+            t[c] = t[c].fillna(0).astype(np.int64)
+        t["AC_snp1"] = t.AC_snp1_ex + t.AC_snp1_gen
+        t["AC_snp2"] = t.AC_snp2_ex + t.AC_snp2_gen
+    return (t)
+
+def check_release(t, n_exome=None, n_genome=None):
+    #raises ValueError if the combined release is not consistent
+    errors = []
+    if t.duplicated(subset=RELEASE_KEY).any():
+        errors.append("{0} duplicated (mnv, transcript_id)".format(t.duplicated(subset=RELEASE_KEY).sum()))
+    if (n_exome is not None) and ((t.AC_mnv_ex > 0).sum() != n_exome):
+        errors.append("exome rows: {0} in the release, {1} in the input".format((t.AC_mnv_ex > 0).sum(), n_exome))
+    if (n_genome is not None) and ((t.AC_mnv_gen > 0).sum() != n_genome):
+        errors.append("genome rows: {0} in the release, {1} in the input".format((t.AC_mnv_gen > 0).sum(), n_genome))
+    if ((t.AC_mnv_ex == 0) & (t.AC_mnv_gen == 0)).any():
+        errors.append("rows with AC_mnv = 0 in both exome and genome")
+    for c in COUNT_COLUMNS:
+        if (t[c] != t[c + "_ex"] + t[c + "_gen"]).any():
+            errors.append("{0} != {0}_ex + {0}_gen".format(c))
+    if ((t.n_indv < 0) | (t.n_homhom * 2 > t.AC_mnv)).any():
+        errors.append("n_indv / n_homhom inconsistent with AC_mnv")
+    if t.categ.isnull().any():
+        errors.append("{0} rows without categ".format(t.categ.isnull().sum()))
+    if len(errors) > 0:
+        raise ValueError("release check failed: " + "; ".join(errors))
+
+def passes(filters):
+    #filter_snp* is '[]' (tsv) or [] (parquet / parsed) when PASS, NaN when the variant is not in the data type
+    return (filters.map(lambda x: (parse_filter(x) is not None) and (len(parse_filter(x)) == 0)).astype(bool))
+
+def split_release(t):
+    #combined, exome only, genome only. the subsets are restricted to the PASS SNVs of the data type if filters are there
+    ex = t.AC_mnv_ex > 0
+    gen = t.AC_mnv_gen > 0
+    if "filter_snp1_ex" in t.columns:
+        ex = ex & passes(t.filter_snp1_ex) & passes(t.filter_snp2_ex)
+        gen = gen & passes(t.filter_snp1_gen) & passes(t.filter_snp2_gen)
+    cols = lambda l: [c for c in l if c in t.columns]
+    return (t[cols(RELEASE_COLUMNS)], t.loc[ex, cols(EXOME_COLUMNS)], t.loc[gen, cols(GENOME_COLUMNS)])
+
+def write_releases(t, out_prefix, parquet=True):
+    #<out_prefix>.tsv, <out_prefix>_exome.tsv, <out_prefix>_genome.tsv (+ .parquet)
+    out_prefix = os.path.expanduser(out_prefix)
+    for (df, s) in zip(split_release(t), ["", "_exome", "_genome"]):
+        df.to_csv(out_prefix + s + ".tsv", sep="\t", index=False, quotechar="?") #dummy quote char, for the filter lists
+        if parquet:
+            write_release_parquet(df, out_prefix + s + ".parquet")
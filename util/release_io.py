@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+__author__ = 'QingboWang'
+
+#typed, columnar (parquet) version of the coding MNV release (mnv_coding_final_release*.tsv / gnomad_mnv_coding.tsv).
+#- filter_snp* are list columns (instead of the '["RF"]' strings, that needed quotechar="?" in the tsv)
+#- categ / consequences / lof / contig are dictionary encoded (pandas categorical)
+#- rows sorted by contig (1..22, X, Y), position, mnv, transcript_id, so that each row group covers a small region
+#  and a query for a region / gene reads only the row groups that can contain it (predicate pushdown).
+#(Usage: release_io.py release_tsv out_parquet)
+
+import json
+import sys
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+CONTIGS = [str(i) for i in range(1, 23)] + ["X", "Y"]
+CATEG_COLUMNS = ["categ", "snp1_consequence", "snp2_consequence", "mnv_consequence", "snp1_lof", "snp2_lof", "mnv_lof"]
+LIST_COLUMNS = ["filter_snp1_ex", "filter_snp1_gen", "filter_snp2_ex", "filter_snp2_gen"]
+INT_COLUMNS = ["locus.position", "n_indv", "AC_mnv", "n_homhom", "n_indv_ex", "AC_mnv_ex", "n_homhom_ex",
+               "n_indv_gen", "AC_mnv_gen", "n_homhom_gen",
+               "AC_snp1", "AC_snp1_ex", "AC_snp1_gen", "AC_snp2", "AC_snp2_ex", "AC_snp2_gen"]
+SORT_KEY = ["locus.contig", "locus.position", "mnv", "transcript_id"]
+ROW_GROUP_SIZE = 20000
+
+
+def parse_filter(x):
+    #'[]' -> [], '["RF"]' -> ["RF"], NaN (variant not in the data) -> None
+    if isinstance(x, list): return (x)
+    if x is None or (isinstance(x, float) and np.isnan(x)): return (None)
+    return (json.loads(x))
+
+def to_release_frame(df):
+    #typed and sorted copy of a release dataframe (as read from the tsv, or as built in mnv_coding_parse.py)
+    df = df.copy()
+    df["locus.contig"] = pd.Categorical(df["locus.contig"].astype(str), categories=CONTIGS, ordered=True)
+    for c in CATEG_COLUMNS:
+        if c in df.columns: df[c] = df[c].astype("category")
+    for c in LIST_COLUMNS:
+        if c in df.columns: df[c] = df[c].map(parse_filter)
+    for c in INT_COLUMNS:
+        if c in df.columns: df[c] = df[c].astype("Int64") #nullable, in case some AC is missing
+    df = df.sort_values(by=[c for c in SORT_KEY if c in df.columns], kind="mergesort")
+    return (df.reset_index(drop=True))
+
+def release_schema(df):
+    #arrow schema: list<string> for the filters, dictionary for the categoricals, the rest inferred by pandas
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    for c in LIST_COLUMNS:
+        if c in df.columns:
+            schema = schema.set(schema.get_field_index(c), pa.field(c, pa.list_(pa.string())))
+    return (schema)
+
+def write_release_parquet(df, path, row_group_size=ROW_GROUP_SIZE, typed=False):
+    #typed=True if df is already the output of to_release_frame
+    if not typed: df = to_release_frame(df)
+    t = pa.Table.from_pandas(df, schema=release_schema(df), preserve_index=False)
+    pq.write_table(t, path, row_group_size=row_group_size, compression="zstd", write_statistics=True)
+
+def release_filters(contig=None, start=None, end=None, transcript=None, categ=None):
+    #predicate for read_release_parquet (list of tuples, as in pyarrow.parquet.read_table(filters=...))
+    f = []
+    if contig is not None: f.append(("locus.contig", "=", str(contig)))
+    if start is not None: f.append(("locus.position", ">=", int(start)))
+    if end is not None: f.append(("locus.position", "<=", int(end)))
+    if transcript is not None: f.append(("transcript_id", "=", transcript))
+    if categ is not None: f.append(("categ", "=", categ))
+    return (f if len(f) > 0 else None)
+
+def read_release_parquet(path, columns=None, contig=None, start=None, end=None, transcript=None, categ=None):
+    #projected columns + predicate pushdown (row groups whose min/max statistics can't match are not read)
+    t = pq.read_table(path, columns=columns, filters=release_filters(contig, start, end, transcript, categ))
+    return (t.to_pandas())
+
+def release_tsv_to_parquet(tsv_path, parquet_path, row_group_size=ROW_GROUP_SIZE):
+    #the existing tsv releases (the combined one was written with quotechar="?")
+    df = pd.read_csv(tsv_path, sep="\t", quotechar="?", dtype={"locus.contig": str})
+    write_release_parquet(df, parquet_path, row_group_size=row_group_size)
+
+
+if __name__ == "__main__":
+    release_tsv_to_parquet(sys.argv[1], sys.argv[2])
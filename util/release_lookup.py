@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+__author__ = 'QingboWang'
+
+#broadcast lookup of small reference tables (e.g. the coding MNV release, gnomad_mnv_coding.tsv)
+#onto huge per sample / per variant hail tables.
+#the reference table is loaded once (pandas, on the driver) and shipped to every partition as a dict literal,
+#keyed by typed (locus, ref, alt) pairs, so annotating it does not need a re-key / shuffle of the huge table
+#(as opposed to final[et.key] joins, which shuffle every time we key by snp1/snp2, snp1/snp1_2 etc).
+
+import hail as hl
+import pandas as pd
+
+
+def snp_pair_key(locus1, alleles1, locus2, alleles2):
+    #key of a SNV pair, from hail locus / alleles expressions (e.g. et.prev_row.locus, et.prev_row.alleles, et.locus, et.alleles)
+    return (hl.tuple([locus1, alleles1[0], alleles1[1], locus2, alleles2[0], alleles2[1]]))
+
+def parse_snp(snp, reference_genome="GRCh37"):
+    #hail string expression "1-138593-G-T" -> (locus, alleles)
+    sp = snp.split("-")
+    return (hl.locus(sp[0], hl.int(sp[1]), reference_genome=reference_genome), hl.array([sp[2], sp[3]]))
+
+def snp_pair_key_from_str(snp1, snp2, reference_genome="GRCh37"):
+    #same key, from the snp1/snp2 string columns of the release format
+    (l1, a1) = parse_snp(snp1, reference_genome)
+    (l2, a2) = parse_snp(snp2, reference_genome)
+    return (snp_pair_key(l1, a1, l2, a2))
+
+def read_release(path, columns=None):
+    #read a release tsv into pandas (all str, typed later per field)
+    with hl.hadoop_open(path, 'r') as f:
+        return (pd.read_csv(f, sep="\t", dtype=str, usecols=columns))
+
+def _py_value(x, t):
+    if pd.isnull(x): return (None)
+    if t == hl.tint32 or t == hl.tint64: return (int(float(x)))
+    if t == hl.tfloat64 or t == hl.tfloat32: return (float(x))
+    return (x)
+
+def release_lookup_dict(df, fields, types=None, key=("snp1", "snp2"), reference_genome="GRCh37"):
+    #python dict: (locus1, ref1, alt1, locus2, ref2, alt2) -> hl.Struct(fields)
+    #if the same snp pair appears more than once (e.g. multiple transcripts), the last one is kept (same as a keyed join picking one)
+    #types: field -> hail type, str if not given
+    if types is None: types = {}
+    d = {}
+    for k1, k2, vals in zip(df[key[0]], df[key[1]], df[list(fields)].itertuples(index=False)):
+        c1, p1, r1, a1 = k1.split("-")
+        c2, p2, r2, a2 = k2.split("-")
+        k = (hl.Locus(c1, int(p1), reference_genome=reference_genome), r1, a1,
+             hl.Locus(c2, int(p2), reference_genome=reference_genome), r2, a2)
+        d[k] = hl.Struct(**{f: _py_value(v, types.get(f, hl.tstr)) for f, v in zip(fields, vals)})
+    return (d)
+
+def load_release_lookup(df, fields, types=None, key=("snp1", "snp2"), reference_genome="GRCh37"):
+    #the broadcast version of release_lookup_dict, as a hail dict literal
+    if types is None: types = {}
+    ltype = hl.tlocus(reference_genome)
+    ktype = hl.ttuple(ltype, hl.tstr, hl.tstr, ltype, hl.tstr, hl.tstr)
+    vtype = hl.tstruct(**{f: types.get(f, hl.tstr) for f in fields})
+    return (hl.literal(release_lookup_dict(df, fields, types, key, reference_genome), dtype=hl.tdict(ktype, vtype)))
+
+def annotate_from_lookup(ht, lookup, key_expr, fields, prefix=""):
+    #annotate the lookup fields (NA if not in the lookup) to ht, optionally with a prefix
+    v = lookup.get(key_expr)
+    return (ht.annotate(**{prefix + f: v[f] for f in fields}))
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+__author__ = 'QingboWang'
+
+#region / transcript queries over the parquet release (release_io.write_release_parquet, sorted by contig / position)
+#instead of loading the whole gnomad_mnv_coding.tsv into pandas and filtering (mnv[mnv.transcript_id==tr]).
+#the index is small (per row group: contig, min / max position. per transcript: row groups), built once and kept
+#next to the parquet file (<parquet>.idx.json), so that a query only reads the row groups that can contain the rows.
+#e.g.
+#  idx = ReleaseIndex("mnv_coding_final_release.parquet")
+#  idx.query_region("1", 138000, 139000)
+#  idx.query_transcript("ENST00000335137")
+
+import json
+import os
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from release_io import CONTIGS
+
+
+class ReleaseIndex(object):
+    def __init__(self, path, rebuild=False):
+        self.path = path
+        self.pf = pq.ParquetFile(path)
+        idx_path = path + ".idx.json"
+        if rebuild or (not os.path.exists(idx_path)) or (os.path.getmtime(idx_path) < os.path.getmtime(path)):
+            self.idx = self.build_index()
+            with open(idx_path, "w") as f:
+                json.dump(self.idx, f)
+        else:
+            with open(idx_path) as f:
+                self.idx = json.load(f)
+
+    def build_index(self):
+        #one row group at a time, only the 3 key columns -> bounded memory
+        regions = [] #(row group, contig, min pos, max pos), one per contig in the row group
+        transcripts = {}
+        for rg in range(self.pf.num_row_groups):
+            t = self.pf.read_row_group(rg, columns=["locus.contig", "locus.position", "transcript_id"]).to_pandas()
+            contig = t["locus.contig"].astype(str)
+            for c, pos in t.groupby(contig, sort=False)["locus.position"]:
+                regions.append([rg, c, int(pos.min()), int(pos.max())])
+            for tx in t.transcript_id.unique():
+                transcripts.setdefault(tx, []).append(rg)
+        return ({"regions": regions, "transcripts": transcripts})
+
+    def _read(self, rgs, columns):
+        read_cols = columns
+        if columns is not None: #the key columns are needed for the row filter
+            read_cols = list(dict.fromkeys(list(columns) + ["locus.contig", "locus.position", "transcript_id"]))
+        if len(rgs) == 0: #same columns, no rows
+            t = self.pf.schema_arrow.empty_table()
+            return ((t if read_cols is None else t.select(read_cols)).to_pandas())
+        return (self.pf.read_row_groups(sorted(set(rgs)), columns=read_cols).to_pandas())
+
+    def region_row_groups(self, contig, start, end):
+        contig = str(contig)
+        return ([rg for (rg, c, s, e) in self.idx["regions"] if (c == contig) and (s <= end) and (e >= start)])
+
+    def query_region(self, contig, start, end, columns=None):
+        #rows with locus.position in [start, end] (1-based, inclusive) on contig
+        t = self._read(self.region_row_groups(contig, start, end), columns)
+        t = t[(t["locus.contig"].astype(str) == str(contig)) & (t["locus.position"] >= start) & (t["locus.position"] <= end)]
+        return (t[columns].reset_index(drop=True) if columns is not None else t.reset_index(drop=True))
+
+    def query_transcript(self, tx, columns=None):
+        t = self._read(self.idx["transcripts"].get(tx, []), columns)
+        t = t[t.transcript_id == tx]
+        return (t[columns].reset_index(drop=True) if columns is not None else t.reset_index(drop=True))
+
+    def transcripts(self):
+        return (sorted(self.idx["transcripts"].keys()))
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+__author__ = 'QingboWang'
+
+#chunked (bounded memory) version of the release assembly (release_assembly.py): one chromosome at a time.
+#the key of the release (contig, position, refs, alts, transcript_id) never spans two chromosomes, so
+#classification, the exome / genome merge, the AC / filter annotation and the split into combined / exome / genome
+#are done per chromosome, and appended to the outputs (tsv + parquet row groups) in the release order.
+#only the per chromosome frames and the running totals (ReleaseStats) are in memory.
+#the (whole genome) annotation tsvs are first split by chromosome, streaming (pd.read_csv(chunksize=...)).
+#each step of each chromosome is a stage (instrument.py: read / assemble / annotate / write, rows in / out).
+
+import os
+import shutil
+import tempfile
+from collections import Counter
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from release_io import CONTIGS, ROW_GROUP_SIZE, release_schema, to_release_frame
+from release_assembly import (CONSEQUENCE_PATH, RELEASE_KEY, annotate_release, assemble_release, check_release,
+                              split_release)
+from tsv_loader import CONSEQUENCE_SCHEMA, load_tsvs
+from instrument import stage
+
+CHUNKSIZE = 500000
+
+
+def split_by_contig(path, out_dir, columns, chunksize=CHUNKSIZE):
+    #tsv with a mnv column (contig-pos-refs-alts) -> one tsv per contig in out_dir, reading chunksize rows at a time
+    #returns {contig: path}
+    out = {}
+    for chunk in pd.read_csv(os.path.expanduser(path), sep="\t", quotechar="?", usecols=RELEASE_KEY + columns,
+                             dtype=str, chunksize=chunksize):
+        for contig, df in chunk.groupby(chunk.mnv.str.split("-", n=1).str[0], sort=False):
+            p = os.path.join(out_dir, "{0}_chr{1}.tsv".format(os.path.basename(path), contig))
+            df.to_csv(p, sep="\t", index=False, quotechar="?", mode="a", header=(contig not in out))
+            out[contig] = p
+    return (out)
+
+def read_contig_annotation(paths, contig, columns):
+    if contig not in paths:
+        return (pd.DataFrame(columns=RELEASE_KEY + columns))
+    df = pd.read_csv(paths[contig], sep="\t", quotechar="?", dtype=str)
+    for c in columns:
+        if c.startswith("AC_"): df[c] = pd.to_numeric(df[c])
+    return (df)
+
+
+class ReleaseStats(object):
+    #running totals over the chunks (for the consistency check at the end, and to print)
+    def __init__(self):
+        self.n_rows = Counter() #output -> rows
+        self.n_input = Counter() #exome / genome -> input rows
+        self.per_contig = Counter()
+        self.categ = Counter()
+        self.ac_mnv = Counter()
+
+    def add(self, contig, outputs, n_exome, n_genome):
+        for (name, df) in outputs.items():
+            self.n_rows[name] += len(df)
+        t = outputs["combined"]
+        self.n_input.update({"exome": n_exome, "genome": n_genome})
+        self.per_contig[contig] += len(t)
+        self.categ.update(t.categ.value_counts().to_dict())
+        self.ac_mnv.update({"ex": int(t.AC_mnv_ex.sum()), "gen": int(t.AC_mnv_gen.sum())})
+
+    def __repr__(self):
+        return ("rows: {0}\ninput: {1}\ncateg: {2}\nAC_mnv: {3}".format(dict(self.n_rows), dict(self.n_input),
+                                                                     dict(self.categ), dict(self.ac_mnv)))
+
+
+class ReleaseWriter(object):
+    #appends chunks (in release order) to <out_prefix>{,_exome,_genome}.tsv and .parquet
+    def __init__(self, out_prefix, parquet=True, row_group_size=ROW_GROUP_SIZE):
+        self.out_prefix = os.path.expanduser(out_prefix)
+        self.parquet = parquet
+        self.row_group_size = row_group_size
+        self.suffix = {"combined": "", "exome": "_exome", "genome": "_genome"}
+        self.writers = {}
+        self.schemas = {}
+        self.header = {}
+
+    def _schema(self, df):
+        #fixed for all the chunks: dictionary index int32 (the number of categories differs per chunk), string values
+        #(a column can be all NaN in the first chunk)
+        schema = release_schema(df)
+        for (i, f) in enumerate(schema):
+            if pa.types.is_dictionary(f.type):
+                schema = schema.set(i, pa.field(f.name, pa.dictionary(pa.int32(), pa.string(), f.type.ordered)))
+        return (schema)
+
+    def write(self, name, df):
+        path = self.out_prefix + self.suffix[name]
+        df.to_csv(path + ".tsv", sep="\t", index=False, quotechar="?", mode="a" if name in self.header else "w",
+                  header=(name not in self.header))
+        self.header[name] = True
+        if self.parquet and len(df) > 0:
+            df = to_release_frame(df)
+            if name not in self.writers:
+                self.schemas[name] = self._schema(df)
+                self.writers[name] = pq.ParquetWriter(path + ".parquet", self.schemas[name], compression="zstd")
+            self.writers[name].write_table(pa.Table.from_pandas(df, schema=self.schemas[name], preserve_index=False),
+                                           row_group_size=self.row_group_size)
+
+    def close(self):
+        for w in self.writers.values():
+            w.close()
+
+
+def stream_release(out_prefix, path_fmt=CONSEQUENCE_PATH, annotations=[], parquet=True, tmp_dir=None, n_workers=4):
+    #annotations: [(tsv path, columns)], e.g. AC_snp* and filter_snp*, joined by (mnv, transcript_id)
+    tmp = tempfile.mkdtemp(dir=tmp_dir)
+    annotations = [(split_by_contig(path, tempfile.mkdtemp(dir=tmp), columns), columns) for (path, columns) in annotations]
+    writer = ReleaseWriter(out_prefix, parquet)
+    stats = ReleaseStats()
+    try:
+        for contig in CONTIGS: #release order
+            exome = [path_fmt.format("exome", contig, d) for d in (1, 2)]
+            genome = [path_fmt.format("genome", contig, d) for d in (1, 2)] if contig != "Y" else []
+            with stage("release_read", contig=contig) as st:
+                dfe = load_tsvs(exome, CONSEQUENCE_SCHEMA, n_workers=n_workers)
+                dfg = load_tsvs(genome, CONSEQUENCE_SCHEMA, n_workers=n_workers)
+                if len(genome) == 0: #empty genome side with the same columns
+                    dfg = dfe.iloc[:0].drop(columns=["categ"], errors="ignore")
+                st.set(rows_out=len(dfe) + len(dfg))
+            with stage("release_assemble", contig=contig, rows_in=len(dfe) + len(dfg)) as st:
+                t = assemble_release(dfe, dfg)
+                st.set(rows_out=len(t))
+            with stage("release_annotate", contig=contig, rows_in=len(t)) as st:
+                for (paths, columns) in annotations:
+                    t = annotate_release(t, read_contig_annotation(paths, contig, columns), columns)
+                check_release(t)
+                st.set(rows_out=len(t))
+            with stage("release_write", contig=contig, rows_in=len(t)) as st:
+                (combined, ex, gen) = split_release(t)
+                outputs = {"combined": combined, "exome": ex, "genome": gen}
+                for (name, df) in outputs.items():
+                    writer.write(name, df)
+                st.set(rows_out=sum([len(df) for df in outputs.values()]))
+            stats.add(contig, outputs, len(dfe), len(dfg))
+            del dfe, dfg, t, combined, ex, gen, outputs
+    finally:
+        writer.close()
+        shutil.rmtree(tmp)
+    return (stats)
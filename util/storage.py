@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+__author__ = 'QingboWang'
+
+#storage layer for the (small) files of the analysis: count matrices, aggregated stats, consequence tables etc.
+#the files are named by logical dataset names (mnv_combined(chr, data_type), cnt_mat(d, categ) ...), relative to the
+#root gs://gnomad-qingbowang/MNV. the full path of a key goes through paths.resolve_path, so a local copy is set up
+#the same way as for resources.py (MNV_PATH_MAP="gs://gnomad-qingbowang/MNV/=/data/mnv/;gs://hail-common/=/data/hail/"),
+#and read / written through a backend:
+#  hadoop: hl.hadoop_open (default when the resolved root is gs://)
+#  local: plain files (default when the resolved root is a local directory)
+#  objstore: a local stand-in for an object store (whole object get / atomic put, no appends)
+#the backend is chosen by the environment variable MNV_STORAGE_BACKEND, or set_storage().
+#small files can be fetched in parallel (prefetch) before the loop that reads them one by one.
+
+import io
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from paths import resolve_path, is_remote
+
+DEFAULT_ROOT = "gs://gnomad-qingbowang/MNV"
+DEFAULT_REFERENCE_ROOT = "gs://hail-common/references"
+
+
+#logical dataset names (relative to the root)
+_mnv_dirs = {"genomes": ("wholegenome", "MNV_chr{0}_combined"),
+             "exomes": ("1206_exome", "MNV_exome_chr{0}_combined"),
+             "genomes_coding": ("1206_genome", "MNV_genome_chr{0}_combined")}
+_short = {"exomes": "exome", "genomes": "genome", "genomes_coding": "genome"}
+
+def mnv_combined(chr, data_type="genomes", ext="ht"):
+    #per chromosome MNV table (combined het / hom counts)
+    (d, f) = _mnv_dirs[data_type]
+    return ("{0}/{1}.{2}".format(d, f.format(chr), ext))
+
+def consequence(chr, d, data_type="exomes"):
+    #per chromosome VEP consequence of SNVs and MNVs in coding region (v2_consequence_*.tsv)
+    t = "genomes_coding" if data_type == "genomes" else data_type
+    return ("{0}/v2_consequence_{1}_chr{2}_d{3}.tsv".format(_mnv_dirs[t][0], _short[t], chr, d))
+
+def cnt_mat(d, categ=None, chr=None, suffix=None):
+    #count matrix, e.g. cnt_mat(1) = wholegenome/cnt_mat_d1.tsv, cnt_mat(2, "Coding_UCSC", chr=3), cnt_mat(1, suffix="hom")
+    name = "wholegenome/cnt_mat_d{0}".format(d)
+    if suffix is not None: name = name + "_" + suffix
+    if categ is not None: name = name + "_" + categ
+    if chr is not None: name = name + "_chr{0}".format(chr)
+    return (name + ".tsv")
+
+def mnv_context(chr, d):
+    #per chromosome / distance MNV with reference context and ac1, ac2, ac_mnv (code/annotate_context.py)
+    return ("wholegenome/MNV_chr{0}_d{1}_context.tsv".format(chr, d))
+
+def agg_stats(name):
+    return ("agg_stats/" + name)
+
+def wholegenome(name):
+    return ("wholegenome/" + name)
+
+
+#backends: key -> resolve_path(root + "/" + key)
+class _Backend(object):
+    def __init__(self, root=DEFAULT_ROOT):
+        self.root = root.rstrip("/")
+    def path(self, key):
+        return (resolve_path(self.root + "/" + key))
+
+class HadoopBackend(_Backend):
+    def open(self, key, mode="r"):
+        import hail as hl
+        return (hl.hadoop_open(self.path(key), mode))
+    def get(self, key):
+        with self.open(key, "rb") as f:
+            return (f.read())
+    def exists(self, key):
+        import hail as hl
+        return (hl.hadoop_exists(self.path(key)))
+
+class LocalBackend(_Backend):
+    def path(self, key):
+        p = _Backend.path(self, key)
+        if is_remote(p): raise ValueError("{0} is not mapped to a local path (MNV_PATH_MAP)".format(p))
+        return (os.path.expanduser(p))
+    def open(self, key, mode="r"):
+        if "w" in mode: os.makedirs(os.path.dirname(self.path(key)), exist_ok=True)
+        return (open(self.path(key), mode))
+    def get(self, key):
+        with open(self.path(key), "rb") as f:
+            return (f.read())
+    def exists(self, key):
+        return (os.path.exists(self.path(key)))
+
+class _PutOnClose(io.BytesIO):
+    def __init__(self, backend, key):
+        io.BytesIO.__init__(self)
+        self._backend, self._key = backend, key
+    def close(self):
+        if not self.closed: self._backend.put(self._key, self.getvalue())
+        io.BytesIO.close(self)
+
+class ObjectStoreBackend(LocalBackend):
+    #a bucket on local disk: one file per key, at the same (directory structured) path as the local backend, so that
+    #path() of a table key (.ht) is a directory hail can read / write. whole object get / put, puts are atomic
+    #(write to a temporary file next to it + rename), no partial reads or appends.
+    def put(self, key, data):
+        d = os.path.dirname(self.path(key))
+        os.makedirs(d, exist_ok=True)
+        (fd, tmp) = tempfile.mkstemp(dir=d, prefix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self.path(key))
+    def open(self, key, mode="r"):
+        if "w" in mode:
+            f = _PutOnClose(self, key)
+            return (f if "b" in mode else io.TextIOWrapper(f, encoding="utf-8"))
+        data = self.get(key)
+        return (io.BytesIO(data) if "b" in mode else io.StringIO(data.decode("utf-8")))
+    def list(self, prefix=""):
+        #the file keys under the root (not inside the .ht directories), starting with prefix
+        top = self.path("")
+        keys = []
+        for (d, dirs, files) in os.walk(top):
+            dirs[:] = [x for x in dirs if not x.endswith(".ht")]
+            keys += [os.path.relpath(os.path.join(d, f), top).replace(os.sep, "/") for f in files if not f.startswith(".tmp")]
+        return (sorted([k for k in keys if k.startswith(prefix)]))
+
+BACKENDS = {"hadoop": HadoopBackend, "local": LocalBackend, "objstore": ObjectStoreBackend}
+
+
+class Storage(object):
+    def __init__(self, backend, reference_root=DEFAULT_REFERENCE_ROOT, n_workers=16):
+        self.backend = backend
+        self.reference_root = reference_root.rstrip("/")
+        self.n_workers = n_workers
+        self._cache = {}
+
+    def path(self, key):
+        #full path of a dataset (e.g. for hl.read_table / export)
+        return (self.backend.path(key))
+
+    def reference(self, name):
+        #e.g. reference("human_g1k_v37.fasta.gz")
+        return (resolve_path(self.reference_root + "/" + name))
+
+    def prefetch(self, keys):
+        #get many small files in parallel, kept in memory until they are read (read_bytes / read_tsv)
+        keys = [k for k in keys if k not in self._cache]
+        with ThreadPoolExecutor(max_workers=self.n_workers) as ex:
+            for k, data in zip(keys, ex.map(self.backend.get, keys)):
+                self._cache[k] = data
+
+    def read_bytes(self, key):
+        if key in self._cache: return (self._cache.pop(key))
+        return (self.backend.get(key))
+
+    def read_tsv(self, key, **kwargs):
+        return (pd.read_csv(io.BytesIO(self.read_bytes(key)), sep="\t", **kwargs))
+
+    def read_tsvs(self, keys, **kwargs):
+        #prefetch + read, in the order of keys
+        self.prefetch(keys)
+        return ([self.read_tsv(k, **kwargs) for k in keys])
+
+    def write_tsv(self, df, key, index=False):
+        with self.backend.open(key, "w") as f:
+            df.to_csv(f, sep="\t", index=index)
+
+    def open(self, key, mode="r"):
+        return (self.backend.open(key, mode))
+
+    def exists(self, key):
+        return (self.backend.exists(key))
+
+
+_storage = None
+
+def set_storage(storage):
+    global _storage
+    _storage = storage
+
+def get_storage():
+    #from the environment, the first time it is called
+    global _storage
+    if _storage is None:
+        backend = os.environ.get("MNV_STORAGE_BACKEND", "hadoop" if is_remote(resolve_path(DEFAULT_ROOT + "/")) else "local")
+        _storage = Storage(BACKENDS[backend](DEFAULT_ROOT))
+    return (_storage)
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+__author__ = 'QingboWang'
+
+#synthetic phased cohort, to run / time the pipelines without the gnomAD data (code/benchmark_pipeline.py).
+#- variants on one contig (SNVs, random positions, a fraction filtered as RF), allele frequencies from a beta
+#- two haplotypes per sample; planted MNVs: a second variant at d=1..10 that copies the haplotypes of the first (in cis)
+#- read backed phasing as in gnomAD: per sample and PID block (block_bp windows), the first het is the pivot (unphased,
+#  PID = its own pos_ref_alt), the following hets are phased relative to it (0|1 if on the pivot haplotype) with the same PID.
+#  a fraction of the blocks is not phased at all (unphased, no PID). hom var are 1/1 without PID.
+#expected_mnv_counts gives the per variant pair counts the discovery (mnv_discovery.discover_mnv) should find.
+
+import numpy as np
+import pandas as pd
+
+BASES = np.array(list("ACGT"))
+
+
+class SyntheticCohort(object):
+    def __init__(self, variants, haps, phased, pid, planted):
+        self.variants = variants #contig, pos, ref, alt, filter (sorted by pos)
+        self.haps = haps #(n_variants, n_samples, 2) 0/1
+        self.phased = phased #(n_variants, n_samples) bool
+        self.pid = pid #(n_variants, n_samples) PID string or None
+        self.planted = planted #pos1, pos2, dist
+
+    @property
+    def n_samples(self):
+        return (self.haps.shape[1])
+
+    def gt(self):
+        return (self.haps.sum(axis=2))
+
+
+def make_cohort(n_samples=100, n_variants=2000, contig="1", start=1000000, length=1000000, n_planted=200,
+                dists=range(1, 11), hom_scale=1.0, af_beta=(0.3, 3.0), phased_frac=0.9, block_bp=100,
+                filter_frac=0.05, seed=0):
+    #hom_scale: >1 more common variants (more hom var), <1 rarer (more het)
+    rng = np.random.default_rng(seed)
+    pos = np.sort(rng.choice(np.arange(start, start + length), n_variants, replace=False))
+    af = np.clip(rng.beta(af_beta[0], af_beta[1] / hom_scale, n_variants), 1.0 / (2 * n_samples), 0.95)
+    haps = (rng.random((n_variants, n_samples, 2)) < af[:, None, None]).astype(np.int8)
+    #planted MNVs: pos + d, same haplotypes
+    anchors = rng.choice(n_variants, min(n_planted, n_variants), replace=False)
+    d = rng.choice(np.array(list(dists)), len(anchors))
+    new_pos = pos[anchors] + d
+    keep = ~np.isin(new_pos, pos)
+    (anchors, d, new_pos) = (anchors[keep], d[keep], new_pos[keep])
+    (new_pos, first) = np.unique(new_pos, return_index=True)
+    (anchors, d) = (anchors[first], d[first])
+    pos = np.concatenate([pos, new_pos])
+    haps = np.concatenate([haps, haps[anchors]])
+    order = np.argsort(pos, kind="stable")
+    (pos, haps) = (pos[order], haps[order])
+    nv = len(pos)
+    ref = rng.integers(0, 4, nv)
+    alt = (ref + rng.integers(1, 4, nv)) % 4
+    variants = pd.DataFrame({"contig": contig, "pos": pos, "ref": BASES[ref], "alt": BASES[alt],
+                             "filter": np.where(rng.random(nv) < filter_frac, "RF", "PASS")})
+    planted = pd.DataFrame({"pos1": new_pos - d, "pos2": new_pos, "dist": d})
+    (phased, pid) = phase(variants, haps, rng, phased_frac, block_bp)
+    return (SyntheticCohort(variants, haps, phased, pid, planted))
+
+def phase(variants, haps, rng, phased_frac, block_bp):
+    #read backed phasing per (sample, block), see above. the followers are re-oriented so that the ones in cis with the
+    #pivot alt are 0|1 (the pivot itself is unphased), as the hethet2 rule of mnv_discovery expects
+    (nv, ns, _) = haps.shape
+    gt = haps.sum(axis=2)
+    phased = np.zeros((nv, ns), dtype=bool)
+    pid = np.full((nv, ns), None, dtype=object)
+    block = variants.pos.values // block_bp
+    ids = (variants.pos.astype(str) + "_" + variants.ref + "_" + variants.alt).values
+    for b in np.unique(block):
+        rows = np.where(block == b)[0]
+        is_phased_block = rng.random(ns) < phased_frac
+        pivot = np.full(ns, -1)
+        for r in rows:
+            het = (gt[r] == 1) & is_phased_block
+            new_pivot = het & (pivot < 0)
+            pivot[new_pivot] = r
+            pid[r, het] = ids[pivot[het]]
+            follow = het & ~new_pivot
+            phased[r, follow] = True
+            #orient: 0|1 if the alt is on the pivot's alt haplotype (in cis), 1|0 otherwise
+            piv_alt0 = haps[pivot[follow], np.where(follow)[0], 0] == 1 #the pivot alt is on haplotype 0
+            cols = np.where(follow)[0][piv_alt0]
+            haps[r, cols] = haps[r, cols][:, ::-1]
+    return ((phased, pid))
+
+def genotype_strings(cohort):
+    h = cohort.haps.astype(str)
+    sep = np.where(cohort.phased, "|", "/")
+    gt = np.char.add(np.char.add(h[:, :, 0], sep), h[:, :, 1])
+    gt = np.where(cohort.phased, gt, np.where(cohort.gt() == 2, "1/1", np.where(cohort.gt() == 1, "0/1", "0/0")))
+    return (gt)
+
+def write_vcf(cohort, path):
+    v = cohort.variants
+    gt = genotype_strings(cohort)
+    pid = np.where(cohort.pid == None, ".", cohort.pid).astype(str)
+    entries = np.char.add(np.char.add(gt, ":"), pid)
+    samples = ["S{0}".format(i) for i in range(cohort.n_samples)]
+    with open(path, "w") as f:
+        f.write("##fileformat=VCFv4.2\n")
+        f.write('##FILTER=<ID=RF,Description="Failed random forest filtering">\n')
+        f.write("##contig=<ID={0}>\n".format(v.contig.iloc[0]))
+        f.write('##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n')
+        f.write('##FORMAT=<ID=PID,Number=1,Type=String,Description="Physical phasing ID">\n')
+        f.write("\t".join(["#CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO", "FORMAT"] + samples) + "\n")
+        for (i, r) in enumerate(v.itertuples(index=False)):
+            f.write("\t".join([r.contig, str(r.pos), ".", r.ref, r.alt, ".", r.filter, ".", "GT:PID"] + list(entries[i])) + "\n")
+
+def expected_mnv_counts(cohort, window=10):
+    #per variant pair (prev = earlier variant, cur = later) counts, with the rules of mnv_discovery.annotate_mnv_classes
+    v = cohort.variants
+    pos = v.pos.values
+    gt = cohort.gt()
+    h = cohort.haps
+    rows = []
+    for j in range(len(pos)):
+        i = j - 1
+        while (i >= 0) and (pos[j] - pos[i] <= window):
+            both = (gt[i] > 0) & (gt[j] > 0)
+            same_pid = (cohort.pid[i] != None) & (cohort.pid[j] != None) & (cohort.pid[i] == cohort.pid[j])
+            both_het = (gt[i] == 1) & (gt[j] == 1)
+            same_gt = (h[i, :, 0] == h[j, :, 0])
+            is_edge = np.array([(p is not None) and (p.split("_")[0] == str(pos[i])) for p in cohort.pid[i]])
+            n = {"n_hethet": int((both & same_pid & cohort.phased[i] & cohort.phased[j] & both_het & same_gt).sum()),
+                 "n_hethet2": int((both & same_pid & cohort.phased[j] & both_het & is_edge & ~cohort.phased[i] &
+                                   (h[j, :, 0] == 0)).sum()),
+                 "n_hethom": int((((gt[j] == 2) & (gt[i] == 1)) | ((gt[j] == 1) & (gt[i] == 2))).sum()),
+                 "n_homhom": int(((gt[i] == 2) & (gt[j] == 2)).sum()),
+                 "n_hemi": 0} #all diploid
+            if sum(n.values()) > 0:
+                rows.append(dict(pos1=int(pos[i]), pos2=int(pos[j]), dist=int(pos[j] - pos[i]), **n))
+            i -= 1
+    return (pd.DataFrame(rows, columns=["pos1", "pos2", "dist", "n_hethet", "n_hethet2", "n_hethom", "n_homhom", "n_hemi"]))
+
+def planted_cis_counts(cohort):
+    #per planted MNV, the samples het at both with the same PID: in cis by construction (the same haplotypes), so
+    #all of them have to be counted in n_hethet (both phased) or n_hethet2 (the first one is the unphased pivot).
+    #from the PIDs only, not from the (re-oriented) haplotypes
+    v = cohort.variants
+    row = pd.Series(np.arange(len(v)), index=v.pos.values)
+    (i, j) = (row[cohort.planted.pos1].values, row[cohort.planted.pos2].values)
+    gt = cohort.gt()
+    same_pid = (cohort.pid[i] != None) & (cohort.pid[i] == cohort.pid[j])
+    return (cohort.planted.assign(n_cis=((gt[i] == 1) & (gt[j] == 1) & same_pid).sum(axis=1)))
+
+def synthetic_consequences(mnv, rng=None, n_transcripts=2):
+    #consequence table (annotate_vep_mnv.py output columns) for MNVs (pos1, pos2, refs, alts, AC_mnv, n_homhom),
+    #with random VEP terms / amino acids, for the classification / release assembly stages
+    rng = np.random.default_rng(0) if rng is None else rng
+    terms = np.array(["missense_variant", "synonymous_variant", "stop_gained", "missense_variant&splice_region_variant",
+                      "stop_lost", "splice_donor_variant"])
+    aas = np.array(["A/T", "P", "R/*", "K/N", "L", "*/W"])
+    n = len(mnv)
+    f = lambda a: rng.choice(a, n)
+    return (pd.DataFrame({"locus.contig": mnv["locus.contig"].values, "locus.position": mnv.pos1.values,
+                          "refs": mnv.refs.values, "alts": mnv.alts.values,
+                          "transcript_id": ["ENST{0:011d}".format(x) for x in rng.integers(0, n_transcripts, n)],
+                          "AC": mnv.AC.values, "prev_AC": mnv.prev_AC.values,
+                          "AC_mnv": mnv.AC_mnv.values, "n_homhom": mnv.n_homhom.values,
+                          "snp1_codons": "aCg/aTg", "snp2_codons": "acG/acT", "mnv_codons": "ACG/ATT",
+                          "snp1_amino_acids": f(aas), "snp2_amino_acids": f(aas), "mnv_amino_acids": f(aas),
+                          "snp1_cons_term": f(terms), "snp2_cons_term": f(terms), "mnv_cons_term": f(terms),
+                          "snp1_lof": np.nan, "snp2_lof": np.nan, "mnv_lof": np.nan}))
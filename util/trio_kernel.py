@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+__author__ = 'QingboWang'
+
+#trio kernel for the het-het parents check (hethet_trio_check.py).
+#instead of splitting the trio matrix table into proband / father / mother and joining the parents' entries back per fam_id,
+#we localize the entries and, per variant, look up the three members of each family by their column index.
+#each call (GT or PBT_GT) is one of 11 states (STATES), and the 4 calls of interest (proband GT, proband PBT_GT, mother PBT_GT, father PBT_GT)
+#are packed into a single code in [0, N_CODES) (base 11: 11**4 = 14641), so that the contingency table is just a count per code.
+
+import hail as hl
+import numpy as np
+import pandas as pd
+
+#0 = missing, 1-3 = unphased 0/0, 0/1, 1/1, 4-7 = phased 0|0, 0|1, 1|0, 1|1, 8-9 = haploid 0, 1 (e.g. fathers on X),
+#10 = other (ploidy > 2, allele index > 1: not in split, biallelic data)
+#haploid calls are kept apart from the missing ones: PBT_GT == NA is what hethet_trio_check.py looks at
+STATES = ["NA", "0/0", "0/1", "1/1", "0|0", "0|1", "1|0", "1|1", "0", "1", "other"]
+N_STATES = len(STATES)
+N_CODES = N_STATES**4 #=14641
+CODE_FIELDS = ["GT", "PBT_GT", "mother_PBT_GT", "father_PBT_GT"] #lowest digit first
+
+
+def call_state(c):
+    #hail call expression -> state (int)
+    return (hl.case()
+            .when(~hl.is_defined(c), 0)
+            .when((c.ploidy == 1) & (c[0] <= 1), 8 + c[0])
+            .when((c.ploidy != 2) | (c[0] > 1) | (c[1] > 1), 10)
+            .when(c.phased, 4 + 2 * c[0] + c[1])
+            .default(1 + c[0] + c[1]))
+
+def pack_states(gt, pbt_gt, mother_pbt_gt, father_pbt_gt):
+    #works for both hail expressions and numpy arrays
+    return (gt + N_STATES * pbt_gt + N_STATES**2 * mother_pbt_gt + N_STATES**3 * father_pbt_gt)
+
+def unpack_codes(codes):
+    #numpy codes -> (n, 4) array of states, in the order of CODE_FIELDS
+    codes = np.asarray(codes)
+    return (np.stack([(codes // N_STATES**i) % N_STATES for i in range(4)], axis=1))
+
+def family_index(mt):
+    #[(proband, father, mother)] column indices of the trio matrix table. -1 if the parent is not in the table
+    mt = mt.add_col_index("col_idx")
+    cols = mt.cols().select("col_idx", "source_trio").collect()
+    idx = {r.s: r.col_idx for r in cols}
+    return ([(r.col_idx, idx.get(r.source_trio.father.s, -1), idx.get(r.source_trio.mother.s, -1))
+             for r in cols if r.s == r.source_trio.proband.s])
+
+def trio_codes(mt, proband_filter=lambda e: e.GT.is_het() & e.adj):
+    #table of variants with an array of codes, one per family where the proband entry passes proband_filter
+    fam = hl.literal(family_index(mt), dtype=hl.tarray(hl.ttuple(hl.tint32, hl.tint32, hl.tint32)))
+    t = mt.localize_entries("e", "cols")
+    def parent_state(i):
+        return (hl.cond(i < 0, 0, call_state(t.e[i].PBT_GT)))
+    def code(f):
+        p = t.e[f[0]]
+        return (hl.cond(hl.or_else(proband_filter(p), False),
+                        pack_states(call_state(p.GT), call_state(p.PBT_GT), parent_state(f[2]), parent_state(f[1])), -1))
+    t = t.select(codes=fam.map(code).filter(lambda x: x >= 0))
+    return (t.select_globals())
+
+def trio_code_counts(mt, proband_filter=lambda e: e.GT.is_het() & e.adj):
+    #counts per code, as an array of length N_CODES. one aggregation over the variants
+    t = trio_codes(mt, proband_filter)
+    cnt = t.aggregate(hl.agg.explode(lambda c: hl.agg.counter(c), t.codes))
+    out = np.zeros(N_CODES, dtype=np.int64)
+    for k, v in cnt.items():
+        out[k] = v
+    return (out)
+
+def bincount_codes(codes):
+    #same as trio_code_counts, for codes already in memory (numpy)
+    return (np.bincount(np.asarray(codes, dtype=np.int64), minlength=N_CODES))
+
+def decode_counts(counts):
+    #counts per code -> contingency table (GT, PBT_GT, mother_PBT_GT, father_PBT_GT, n), observed codes only
+    obs = np.nonzero(counts)[0]
+    st = unpack_codes(obs)
+    df = pd.DataFrame({f: np.array(STATES)[st[:, i]] for i, f in enumerate(CODE_FIELDS)})
+    df["n"] = counts[obs]
+    return (df)
+
+def state_to_call(s):
+    #for writing the contingency table with call types, as in the join based version ("NA", "other" -> missing call)
+    if s in ["NA", "other"]: return (None)
+    if len(s) == 1: return (hl.Call([int(s)]))
+    return (hl.Call([int(s[0]), int(s[2])], phased=(s[1] == "|")))
+
+def counts_to_ht(counts):
+    #one row per observed code. "other" has no call of its own: its call is missing and other=True, so that it stays
+    #apart from the really missing ones (other=False)
+    df = decode_counts(counts)
+    schema = hl.tstruct(**{f: hl.tcall for f in CODE_FIELDS}, other=hl.tbool, n=hl.tint64)
+    return (hl.Table.parallelize([hl.Struct(**{f: state_to_call(getattr(r, f)) for f in CODE_FIELDS},
+                                            other=any([getattr(r, f) == "other" for f in CODE_FIELDS]), n=int(r.n))
+                                  for r in df.itertuples(index=False)], schema))
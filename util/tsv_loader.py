@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+__author__ = 'QingboWang'
+
+#loading many small tsvs (per chromosome / per distance / per annotation) with a declared schema, concurrently.
+#a schema says which columns are ints (nullable Int64 if they can be missing, no astype(int) after the fact),
+#categoricals, lists ('["RF"]' -> ["RF"]) and strings, so that every file comes out with the same dtypes.
+#e.g.
+#  files = expand_pattern("~/Downloads/v2_consequence_exome_chr{chr}_d{d}.tsv", chr=CONTIGS, d=[1, 2])
+#  df = load_tsvs(files, CONSEQUENCE_SCHEMA) #one frame, with the chr / d columns added
+#  (labels, x) = load_cnt_matrices([cnt_mat(d) for d in range(1, 11)], storage=get_storage()) #10 x 16 x 16 tensor
+#  (labels, x) = cnt_tensor(get_cnt_tensor(mnv, lambda t: t.onestep).to_pandas(), range(1, 11), [True, False]) #2 x 10 x 16 x 16
+
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from release_io import parse_filter
+from mnv_symmetry import kmer_labels
+
+
+class TableSchema(object):
+    def __init__(self, dtypes={}, categoricals=[], lists=[], index_col=None):
+        self.dtypes = dict(dtypes) #column -> numpy / pandas dtype (e.g. "int64", "Int64", "float64", str)
+        self.categoricals = list(categoricals) #read as str, made categorical after the concatenation (same categories)
+        self.lists = list(lists) #json lists
+        self.index_col = index_col
+
+    def read_kwargs(self):
+        dtype = dict(self.dtypes)
+        for c in self.categoricals + self.lists:
+            dtype[c] = str
+        return ({"dtype": dtype, "index_col": self.index_col})
+
+    def finish(self, df):
+        #list parsing per file (in the worker), categoricals are done after the concatenation
+        for c in self.lists:
+            if c in df.columns: df[c] = df[c].map(parse_filter)
+        return (df)
+
+    def categorize(self, df):
+        for c in self.categoricals:
+            if c in df.columns: df[c] = df[c].astype("category")
+        return (df)
+
+
+#per chromosome VEP consequence tables (annotate_vep_mnv.py output)
+CONSEQUENCE_SCHEMA = TableSchema(
+    dtypes={"locus.contig": str, "locus.position": "int64", "refs": str, "alts": str, "transcript_id": str,
+            "AC": "Int64", "prev_AC": "Int64", "AC_mnv": "int64", "n_homhom": "int64",
+            "snp1_codons": str, "snp2_codons": str, "mnv_codons": str,
+            "snp1_amino_acids": str, "snp2_amino_acids": str, "mnv_amino_acids": str,
+            "snp1_cons_term": str, "snp2_cons_term": str, "mnv_cons_term": str},
+    categoricals=["snp1_lof", "snp2_lof", "mnv_lof"])
+
+#count matrices (get_cnt_matrix.py output, ref x alt, no index column: the rows are in the order of the columns)
+CNT_MAT_SCHEMA = TableSchema(dtypes={})
+
+
+def expand_pattern(pattern, **fields):
+    #"..._chr{chr}_d{d}.tsv", chr=[...], d=[...] -> [({"chr": "1", "d": 1}, path), ...], in the order of the fields
+    keys = [{}]
+    for (name, values) in fields.items():
+        keys = [dict(k, **{name: v}) for k in keys for v in values]
+    return ([(k, pattern.format(**k)) for k in keys])
+
+def _read_local(args):
+    (path, schema) = args
+    return (schema.finish(pd.read_csv(os.path.expanduser(path), sep="\t", **schema.read_kwargs())))
+
+def read_tables(paths, schema, storage=None, n_workers=8, processes=False):
+    #list of frames, in the order of paths. storage: read the keys through the storage backend (storage.py)
+    #processes=True: local files parsed in a process pool (for large files, where the parsing is the bottleneck)
+    if storage is not None:
+        storage.prefetch(paths)
+        read = lambda k: schema.finish(pd.read_csv(io.BytesIO(storage.read_bytes(k)), sep="\t", **schema.read_kwargs()))
+        with ThreadPoolExecutor(max_workers=n_workers) as ex:
+            return (list(ex.map(read, paths)))
+    pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with pool(max_workers=n_workers) as ex:
+        return (list(ex.map(_read_local, [(p, schema) for p in paths])))
+
+def load_tsvs(files, schema, storage=None, n_workers=8, processes=False):
+    #files: list of paths, or of (fields, path) from expand_pattern (the fields are added as columns)
+    #-> one frame, typed as in the schema
+    if len(files) > 0 and isinstance(files[0], tuple):
+        (fields, paths) = zip(*files)
+    else:
+        (fields, paths) = ([{}] * len(files), files)
+    dfs = read_tables(list(paths), schema, storage, n_workers, processes)
+    for (f, df) in zip(fields, dfs):
+        for (k, v) in f.items():
+            df[k] = v
+    if len(dfs) == 0:
+        return (pd.DataFrame(columns=list(schema.dtypes.keys())))
+    return (schema.categorize(pd.concat(dfs, ignore_index=(schema.index_col is None))))
+
+def load_cnt_matrices(keys, storage=None, n_workers=8, strip_n=False, schema=CNT_MAT_SCHEMA):
+    #square count matrices (same labels) -> (labels, int64 array of shape (len(keys), n, n)), missing cells = 0
+    #strip_n=True: labels without the Ns in the middle (e.g. "ANC" -> "AC"), so that all the distances have the same labels
+    dfs = read_tables(list(keys), schema, storage, n_workers)
+    label = lambda df: list(df.columns.str.replace("N", "")) if strip_n else list(df.columns)
+    labels = label(dfs[0])
+    for (k, df) in zip(keys, dfs):
+        if label(df) != labels:
+            raise ValueError("{0}: labels differ from {1}".format(k, keys[0]))
+    return ((labels, np.stack([df.fillna(0).values for df in dfs]).astype(np.int64)))
+
+def cnt_matrix_frame(labels, x):
+    #one matrix of the tensor back as the frame get_cnt_matrix.py wrote (index = columns)
+    return (pd.DataFrame(x, index=labels, columns=labels))
+
+def cnt_tensor(df, dists, strata=[None], labels=None):
+    #long counts (dist, stratum, refs, alts, cnt: cnt_matrix.get_cnt_tensor) -> (labels, int64 array (strata, dists, n, n))
+    #labels: the SNP pairs without the Ns (default the 16 2-mers), so that all the distances have the same labels
+    labels = kmer_labels(2) if labels is None else list(labels)
+    x = np.zeros((len(strata), len(dists), len(labels), len(labels)), dtype=np.int64)
+    stratum = df.stratum.astype(object).where(df.stratum.notna(), None)
+    ix = [pd.Index(list(strata), dtype=object).get_indexer(stratum), pd.Index(list(dists)).get_indexer(df.dist),
+          pd.Index(labels).get_indexer(df.refs), pd.Index(labels).get_indexer(df.alts)]
+    ok = np.all([i >= 0 for i in ix], axis=0)
+    np.add.at(x, tuple([i[ok] for i in ix]), df.cnt.values[ok].astype(np.int64))
+    return ((labels, x))
+
+def with_n(labels, d):
+    #"GA" -> "GNA" for d=2: the labels of the per distance matrices
+    return ([l[0] + "N" * (d - 1) + l[1:] for l in labels])
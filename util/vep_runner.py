@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+__author__ = 'QingboWang'
+
+#VEP outside of the hail partitions: the variants (sorted) are cut into blocks of block_size, each block is one VEP
+#process (the "command" of the hail VEP config json, vcf lines in, --json lines out), n_workers processes at a time.
+#a failing block is retried (retries, with backoff), then split in halves so that a single bad variant doesn't kill
+#the chromosome (it is left without annotation, or raises with strict=True).
+#finished blocks are written in input order as soon as all the blocks before them are done, so the output file
+#(contig, pos, ref, alt, vep json) is sorted. at most 2 x n_workers blocks are running or waiting to be written (a
+#slow / retried block stops the submission, not the memory), the sites themselves (4 short columns) are all in memory.
+#  run_vep(sites, read_config(vep_config), "vep_out.tsv", block_size=1000, n_workers=8)
+#  vep(t, vep_config, name="snp2_vep")  #drop in for hl.vep in the release scripts: uses the runner if MNV_VEP_RUNNER=1
+#a stand-in VEP for local tests: stub_config() (this file with "stub": echoes consequences derived from the alleles)
+#(Usage: vep_runner.py run sites.tsv out.tsv [--config vep.json | --stub] [--block_size 1000] [--n_workers 4])
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time as tm
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import pandas as pd
+
+CONTIGS = [str(i) for i in range(1, 23)] + ["X", "Y", "MT"]
+OUT_COLUMNS = ["contig", "pos", "ref", "alt", "vep"]
+
+
+class VepError(Exception):
+    pass
+
+
+def read_config(path):
+    if "://" in path:
+        import hail as hl
+        with hl.hadoop_open(path) as f:
+            return (json.load(f))
+    with open(path) as f:
+        return (json.load(f))
+
+def stub_config(fail_rate=0.0, delay=0.0):
+    #fail_rate: fraction of the calls that exit with an error (to exercise the retries)
+    return ({"command": [sys.executable, os.path.abspath(__file__), "stub", "--fail_rate", str(fail_rate), "--delay", str(delay)],
+             "env": {}})
+
+
+#sites -> vcf lines, blocks
+def sort_sites(sites):
+    #contig, pos, ref, alt (one row per variant)
+    sites = sites[["contig", "pos", "ref", "alt"]].drop_duplicates().copy()
+    sites["contig"] = sites.contig.astype(str)
+    order = {c: i for (i, c) in enumerate(CONTIGS)}
+    sites["_c"] = sites.contig.map(lambda c: order.get(c, len(order)))
+    sites = sites.sort_values(["_c", "contig", "pos", "ref", "alt"], kind="mergesort")
+    return (sites.drop(columns="_c").reset_index(drop=True))
+
+def vcf_lines(sites):
+    #the way hail feeds VEP: CHROM POS ID REF ALT QUAL FILTER INFO
+    return (["{0}\t{1}\t.\t{2}\t{3}\t.\t.\t.".format(c, p, r, a) for (c, p, r, a) in
+             zip(sites.contig, sites.pos, sites.ref, sites.alt)])
+
+def blocks(lines, block_size):
+    for i in range(0, len(lines), block_size):
+        yield (lines[i:i + block_size])
+
+
+#one block
+def run_block(config, lines, timeout=None):
+    #[(line, vep json string or None)] in the order of lines. raises VepError if VEP fails
+    env = dict(os.environ, **config.get("env", {}))
+    p = subprocess.run(config["command"], input="\n".join(lines) + "\n", stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                       universal_newlines=True, env=env, timeout=timeout)
+    if p.returncode != 0:
+        raise VepError("VEP exited with {0}: {1}".format(p.returncode, p.stderr.strip()[-500:]))
+    out = {}
+    for l in p.stdout.splitlines():
+        if l.strip():
+            out[json.loads(l)["input"]] = l
+    return ([(x, out.get(x)) for x in lines])
+
+def run_block_retry(config, lines, retries=2, backoff=1.0, timeout=None, strict=False):
+    #(results, n_failed_calls, failed lines)
+    n_fail = 0
+    for attempt in range(retries + 1):
+        try:
+            return ((run_block(config, lines, timeout), n_fail, []))
+        except (VepError, subprocess.TimeoutExpired, OSError, ValueError) as e:
+            n_fail += 1
+            err = e
+            if attempt < retries: tm.sleep(backoff * 2 ** attempt)
+    if len(lines) > 1: #isolate the variant(s) VEP can't take
+        h = len(lines) // 2
+        (r1, f1, bad1) = run_block_retry(config, lines[:h], retries, backoff, timeout, strict)
+        (r2, f2, bad2) = run_block_retry(config, lines[h:], retries, backoff, timeout, strict)
+        return ((r1 + r2, n_fail + f1 + f2, bad1 + bad2))
+    if strict:
+        raise VepError("VEP failed on {0}: {1}".format(lines[0], err))
+    return (([(lines[0], None)], n_fail, lines))
+
+
+#all the blocks
+def write_block(f, results):
+    for (line, v) in results:
+        (c, p, _, r, a) = line.split("\t")[:5]
+        f.write("\t".join([c, p, r, a, "" if v is None else v]) + "\n")
+
+def run_vep(sites, config, out_path, block_size=1000, n_workers=4, retries=2, backoff=1.0, timeout=None, strict=False):
+    #sites: DataFrame contig, pos, ref, alt. writes out_path (tsv, OUT_COLUMNS, sorted), returns stats
+    t0 = tm.time()
+    lines = vcf_lines(sort_sites(sites))
+    todo = enumerate(blocks(lines, block_size))
+    n_blocks = (len(lines) + block_size - 1) // block_size
+    stats = {"n_variants": len(lines), "n_blocks": n_blocks, "n_failed_calls": 0, "failed": [], "max_blocks_held": 0}
+    done = {} #block index -> results, waiting for the blocks before them
+    next_out = 0
+    tmp = out_path + ".tmp"
+    with open(tmp, "w") as f, ThreadPoolExecutor(max_workers=n_workers) as ex:
+        f.write("\t".join(OUT_COLUMNS) + "\n")
+        running = {}
+        def submit():
+            #the finished blocks waiting for an earlier one count too
+            while len(running) + len(done) < 2 * n_workers:
+                nxt = next(todo, None)
+                if nxt is None: break
+                running[ex.submit(run_block_retry, config, nxt[1], retries, backoff, timeout, strict)] = nxt[0]
+            stats["max_blocks_held"] = max(stats["max_blocks_held"], len(running) + len(done))
+        submit()
+        while running:
+            (finished, _) = wait(list(running), return_when=FIRST_COMPLETED)
+            for fut in finished:
+                i = running.pop(fut)
+                (res, n_fail, bad) = fut.result()
+                stats["n_failed_calls"] += n_fail
+                stats["failed"] += bad
+                done[i] = res
+            while next_out in done:
+                write_block(f, done.pop(next_out))
+                next_out += 1
+            submit()
+    os.replace(tmp, out_path)
+    stats["wall_s"] = round(tm.time() - t0, 3)
+    return (stats)
+
+def read_vep_output(path, parse=False):
+    df = pd.read_csv(path, sep="\t", dtype={"contig": str, "ref": str, "alt": str, "vep": str}, keep_default_na=False)
+    if parse:
+        df["vep"] = [json.loads(v) if v else None for v in df.vep]
+    return (df)
+
+
+#hail: drop in for hl.vep
+def vep_table(t, config_path, name="vep", block_size=1000, n_workers=None, work_dir=None):
+    #t keyed by locus, alleles. sites collected to the driver, VEP run here, result imported back as t[name].
+    #all the sites of t go through to_pandas (contig, pos, ref, alt only: ~100 bytes per site, e.g. ~1GB for 10M),
+    #so t should be one chromosome / distance at a time, as in the release scripts
+    import hail as hl
+    config = read_config(config_path)
+    n_workers = int(os.environ.get("MNV_VEP_WORKERS", os.cpu_count() or 4)) if n_workers is None else n_workers
+    k = t.key_by()
+    sites = k.select(contig=k.locus.contig, pos=k.locus.position, ref=k.alleles[0], alt=k.alleles[1]).to_pandas()
+    local = tempfile.mkdtemp()
+    out = os.path.join(local, name + ".tsv")
+    stats = run_vep(sites, config, out, block_size=block_size, n_workers=n_workers)
+    print ("[vep] {0}: {1} variants in {2} blocks, {3} failed calls, {4} variants without annotation, {5}s".format(
+        name, stats["n_variants"], stats["n_blocks"], stats["n_failed_calls"], len(stats["failed"]), stats["wall_s"]))
+    path = "file://" + out
+    if work_dir is not None: #cluster: the workers can't see the driver's disk
+        path = "{0}/{1}.tsv".format(work_dir, name)
+        hl.hadoop_copy("file://" + out, path)
+    res = hl.import_table(path, types={"pos": hl.tint32}, missing="")
+    res = res.key_by(locus=hl.locus(res.contig, res.pos, reference_genome=t.locus.dtype.reference_genome),
+                     alleles=[res.ref, res.alt])
+    res = res.select(vep=hl.parse_json(res.vep, hl.dtype(config["vep_json_schema"])))
+    return (t.annotate(**{name: res[t.key].vep}))
+
+def vep(t, config_path, name="vep", block_size=1000):
+    #hl.vep, or vep_table if MNV_VEP_RUNNER=1 (MNV_VEP_WORKERS processes, MNV_VEP_WORK_DIR for the cluster)
+    import hail as hl
+    if os.environ.get("MNV_VEP_RUNNER", "0") == "1":
+        return (vep_table(t, config_path, name=name, block_size=block_size, work_dir=os.environ.get("MNV_VEP_WORK_DIR")))
+    return (hl.vep(t, config_path, name=name, block_size=block_size))
+
+
+#stand-in VEP
+STUB_TERMS = ["missense_variant", "synonymous_variant", "stop_gained", "splice_region_variant", "intron_variant"]
+
+def stub_annotation(line):
+    (c, p, _, r, a) = line.split("\t")[:5]
+    h = int(hashlib.md5(line.encode()).hexdigest(), 16)
+    term = STUB_TERMS[h % len(STUB_TERMS)]
+    return ({"input": line, "seq_region_name": c, "start": int(p), "allele_string": r + "/" + a,
+             "most_severe_consequence": term,
+             "transcript_consequences": [{"transcript_id": "ENST{0:011d}".format(h % 1000), "canonical": 1,
+                                          "consequence_terms": [term], "codons": r.lower() + "/" + a.lower(),
+                                          "amino_acids": "AR"[h % 2] + "/" + "KL"[(h >> 1) % 2]}]})
+
+def stub_main(fail_rate, delay):
+    if random.random() < fail_rate:
+        sys.stderr.write("stub VEP: simulated failure\n")
+        sys.exit(1)
+    for line in sys.stdin:
+        line = line.rstrip("\n")
+        if line:
+            sys.stdout.write(json.dumps(stub_annotation(line)) + "\n")
+    tm.sleep(delay)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["run", "stub"])
+    parser.add_argument("sites", nargs="?")
+    parser.add_argument("out", nargs="?")
+    parser.add_argument("--config")
+    parser.add_argument("--stub", action="store_true")
+    parser.add_argument("--block_size", type=int, default=1000)
+    parser.add_argument("--n_workers", type=int, default=4)
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--fail_rate", type=float, default=0.0)
+    parser.add_argument("--delay", type=float, default=0.0)
+    args = parser.parse_args()
+    if args.command == "stub":
+        stub_main(args.fail_rate, args.delay)
+    else:
+        config = stub_config(args.fail_rate, args.delay) if args.stub else read_config(args.config)
+        sites = pd.read_csv(args.sites, sep="\t", dtype={"contig": str, "ref": str, "alt": str})
+        stats = run_vep(sites, config, args.out, block_size=args.block_size, n_workers=args.n_workers, retries=args.retries)
+        print (json.dumps(dict(stats, failed=len(stats["failed"]))))